@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel, EmailStr, Field
 from app.schemas.user_schema import UserResponse
 
@@ -8,6 +9,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str = ""
+    user_id: Optional[int] = None
 
 class LoginResponse(BaseModel):
     """Response schema for login endpoint"""
@@ -3,7 +3,8 @@ from sqlalchemy.future import select
 from app.models.models import User
 from app.schemas.user_schema import UserCreate, UserOut, UserLogin
 from app.auth.auth_schema import Token, LoginResponse
-from app.auth.jwt_helper import pwd_context, create_access_token
+from app.auth.jwt_helper import create_access_token
+from app.auth.password_hasher import password_hasher
 from fastapi import HTTPException, status
 
 
@@ -17,7 +18,7 @@ async def create_user(user: UserCreate, db: AsyncSession) -> dict:
             detail="Email is already registered.",
         )
 
-    hashed_pwd = pwd_context.hash(user.password)
+    hashed_pwd = await password_hasher.hash(user.password)
     new_user = User(
         username=user.username,
         email=user.email,
@@ -42,7 +43,7 @@ async def authenticate_user(user: UserLogin, db: AsyncSession) -> dict:
     result = await db.execute(select(User).where(User.email == user.email))
     db_user = result.scalar_one_or_none()
 
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+    if not db_user or not await password_hasher.verify(user.password, db_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
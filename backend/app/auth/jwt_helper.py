@@ -5,6 +5,10 @@ from decouple import config
 from app.auth.auth_schema import TokenData
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials 
+from sqlalchemy.future import select
+from app.db import AsyncSessionLocal
+from app.models.models import User
+from app.auth.token_cache import token_cache
 
 SECRET_KEY = config("SECRET_KEY", default="your_default_secret_key")
 ALGORITHM = config("ALGORITHM", default="HS256")
@@ -40,24 +44,53 @@ def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
+def credentials_exception(detail: str = "Invalid token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def authenticate_token(token: str) -> TokenData:
+    """The user a bearer token was issued to.
+
+    Verified tokens are cached until they expire (see token_cache), so only
+    the first request with a token checks its signature and looks the user
+    up.
+    """
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return TokenData(username=username)
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise credentials_exception()
+    username = payload.get("username")
+    if not username or "exp" not in payload:
+        raise credentials_exception()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User.user_id).where(User.username == username))
+        user_id = result.scalar_one_or_none()
+    if user_id is None:
+        raise credentials_exception()
+
+    principal = TokenData(username=username, user_id=user_id)
+    token_cache.put(token, principal, float(payload["exp"]))
+    return principal
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)) -> TokenData:
+    return await authenticate_token(credentials.credentials)
+
+
+def require_user(current_user: TokenData, user_id: int):
+    """Reject requests for another user's resources."""
+    if current_user.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed for this user")
+
 
 def generate_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -0,0 +1,99 @@
+from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from fastapi import HTTPException, status
+import asyncio
+import time
+
+from app.auth.jwt_helper import pwd_context
+
+# bcrypt releases the GIL, so each thread keeps one core busy. Every worker
+# process gets its own pool; leave cores for the event loops.
+PASSWORD_HASH_THREADS = int(config("PASSWORD_HASH_THREADS", default="2"))
+# Requests allowed to wait for a thread before new ones are turned away
+PASSWORD_HASH_MAX_QUEUE = int(config("PASSWORD_HASH_MAX_QUEUE", default="64"))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(config("PASSWORD_HASH_QUEUE_TIMEOUT", default="5"))
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small thread pool so that logins and signups do not
+    block the event loop, and with it every WebSocket on the worker.
+
+    At most `threads` hashes run at once. Callers beyond that wait in line
+    (the time they wait is reported by `stats`), and when the line is full
+    or the wait exceeds `queue_timeout` the request fails with 503.
+    """
+
+    def __init__(self, threads: int = PASSWORD_HASH_THREADS, max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+                 queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT) -> None:
+        self.threads = threads
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="bcrypt")
+        self.slots = asyncio.Semaphore(threads)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.work_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    async def _run(self, fn, *args):
+        if self.waiting >= self.max_queue:
+            self._reject()
+
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        waited = started - queued
+        self.queue_seconds += waited
+        self.max_queue_seconds = max(self.max_queue_seconds, waited)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.work_seconds += time.perf_counter() - started
+            self.slots.release()
+
+    def _reject(self):
+        self.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in attempts in progress, try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "threads": self.threads,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_seconds_total": round(self.queue_seconds, 6),
+            "queue_seconds_max": round(self.max_queue_seconds, 6),
+            "queue_seconds_avg": round(self.queue_seconds / self.completed, 6) if self.completed else 0.0,
+            "hash_seconds_avg": round(self.work_seconds / self.completed, 6) if self.completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
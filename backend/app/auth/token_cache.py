@@ -0,0 +1,60 @@
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from decouple import config
+import hashlib
+import time
+
+from app.auth.auth_schema import TokenData
+
+TOKEN_CACHE_MAX_ENTRIES = int(config("TOKEN_CACHE_MAX_ENTRIES", default="10000"))
+# Upper bound on how long a verified token is trusted without looking the
+# user up again, so deleted or renamed users lose access within this time
+TOKEN_CACHE_TTL = float(config("TOKEN_CACHE_TTL", default="300"))
+
+
+class TokenCache:
+    """Bounded LRU of verified bearer tokens and the user they belong to.
+
+    Entries expire at the token's exp claim or after `ttl`, whichever comes
+    first. Tokens are keyed by digest, so the cache holds no usable tokens.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES, ttl: float = TOKEN_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Key: token digest; value: (expires_at as a Unix time, principal)
+        self.entries: "OrderedDict[bytes, Tuple[float, TokenData]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token: str) -> Optional[TokenData]:
+        key = self.key(token)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, token: str, principal: TokenData, exp: float):
+        self.entries[self.key(token)] = (min(exp, time.time() + self.ttl), principal)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        for key in [key for key, (_, principal) in self.entries.items() if principal.user_id == user_id]:
+            del self.entries[key]
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+token_cache = TokenCache()
@@ -1,6 +1,12 @@
+from typing import Dict
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from decouple import config
+import time
+
+from app.query_log import query_log
 
 db_user = config("DB_USER", default="vaibhav")
 db_password = config("DB_PASSWORD", default="smart0911102")
@@ -8,16 +14,85 @@ db_host = config("DB_HOST", default="localhost")
 db_port = config("DB_PORT", default="5432")
 db_name = config("DB_NAME", default="smartnotes")
 
+# Per worker process: with gunicorn -w 4, Postgres sees up to
+# 4 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections from the API, which has to
+# stay below max_connections minus whatever else connects (migrations, psql).
+DB_POOL_SIZE = int(config("DB_POOL_SIZE", default="5"))
+DB_MAX_OVERFLOW = int(config("DB_MAX_OVERFLOW", default="5"))
+DB_POOL_TIMEOUT = float(config("DB_POOL_TIMEOUT", default="10"))
+DB_POOL_RECYCLE = int(config("DB_POOL_RECYCLE", default="1800"))
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default="true", cast=bool)
+DB_STATEMENT_TIMEOUT_MS = int(config("DB_STATEMENT_TIMEOUT_MS", default="15000"))
+# Prepared statements cached per connection. Set to 0 behind PgBouncer in
+# transaction mode, where a statement may be prepared on another backend.
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(config("DB_PREPARED_STATEMENT_CACHE_SIZE", default="100"))
+# SQLAlchemy's own statement and parameter logging, for local debugging only;
+# production timing goes through app.query_log
+SQL_ECHO = config("SQL_ECHO", default="false", cast=bool)
+
 DATABASE_URL = (
     f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 )
 
 
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts take.
+
+    A checkout waits when all DB_POOL_SIZE + DB_MAX_OVERFLOW connections are
+    in use. The time also covers opening a new connection and the pre-ping,
+    and `waiting` counts every checkout in progress.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.waiting -= 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def recreate(self):
+        # Keep counting across dispose()
+        pool = super().recreate()
+        pool.checkouts, pool.wait_seconds = self.checkouts, self.wait_seconds
+        pool.max_wait_seconds, pool.timeouts = self.max_wait_seconds, self.timeouts
+        return pool
+
+
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,
+    echo=SQL_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    # Engine-only: DATABASE_URL is shared with the Postgres backplane, whose
+    # plain asyncpg connection would send URL parameters to the server
+    connect_args={
+        "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+    },
 )
 
+query_log.instrument(engine.sync_engine)
+
 AsyncSessionLocal = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -25,6 +100,23 @@ AsyncSessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def pool_stats() -> Dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "waiting": pool.waiting,
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "wait_seconds_total": round(pool.wait_seconds, 6),
+        "wait_seconds_max": round(pool.max_wait_seconds, 6),
+        "wait_seconds_avg": round(pool.wait_seconds / pool.checkouts, 6) if pool.checkouts else 0.0,
+    }
+
+
 async def get_db():
     session = AsyncSessionLocal()
     try:
@@ -1,18 +1,51 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.db import AsyncSession, get_db
+from sqlalchemy import text
+from app.db import AsyncSession, engine, get_db
+from app.query_log import query_log
 from app.auth.auth_routes import router as auth_router
 from app.routes.user_routes import router as user_router
 from app.routes.directory_routes import router as directory_router
 from app.routes.document_routes import router as document_router
-from app.routes.websocket import router as websocket_router
+from app.routes.websocket import router as websocket_router, manager as document_manager
 from app.routes.access_document_routes import router as access_document_router
+from app.routes.revision_routes import router as revision_router
+from app.routes.metrics_routes import router as metrics_router
+from app.models.tree_cache import tree_cache
+from app.models.inverted_index import search_index
 from app.auth.jwt_helper import get_current_user
+from app.auth.password_hasher import password_hasher
 from app.auth.auth_schema import TokenData
 from decouple import config
+import logging
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    query_log.start()
+    # Open the first pooled connection before serving, so a bad DB_* setting
+    # shows up in the worker's startup log rather than on the first request
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception:
+        logger.exception("Database is not reachable at startup")
+
+    yield
+
+    await document_manager.shutdown()
+    await tree_cache.close()
+    await search_index.close()
+    password_hasher.close()
+    # Last: the shutdown steps above flush pending edits through the pool
+    await engine.dispose()
+    query_log.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 origins = config("ALLOWED_ORIGINS").split(",")
 print(f"\n\n{origins}\n\n")
 app.add_middleware(
@@ -30,6 +63,9 @@ app.include_router(user_router)
 app.include_router(directory_router)
 app.include_router(document_router)
 app.include_router(access_document_router)
+app.include_router(revision_router)
+app.include_router(metrics_router)
+
 
 @app.get("/test")
 async def test():
@@ -0,0 +1,298 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decouple import config
+import asyncio
+import base64
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str, Dict], Awaitable[None]]
+
+CHANNEL = config("COLLAB_CHANNEL", default="smartnotes_collab")
+# Redis sequencer claims expire unless renewed, which DocumentManager does
+# every COLLAB_PING_INTERVAL seconds; keep this a few intervals long
+CLAIM_TTL = int(config("COLLAB_CLAIM_TTL", default="60"))
+# Largest encoded message any backplane publishes; full-content updates of
+# big notes are the largest
+MAX_MESSAGE_BYTES = int(config("COLLAB_BACKPLANE_MAX_BYTES", default=str(4 * 1024 * 1024)))
+
+
+class BackplaneError(Exception):
+    pass
+
+
+class Backplane(ABC):
+    """Relays collaboration broadcasts to the other workers/nodes.
+
+    Local sockets are served directly by DocumentManager; a backplane only
+    carries messages to peers in other processes, which hand them to their
+    own `handler`. Messages published by this node are never handed back.
+
+    A backplane also hands out per-document claims: at most one node holds
+    a document's claim at a time, and DocumentManager makes that node the
+    document's sequencer. A claim ends with `release` or when its node
+    goes away.
+    """
+
+    def __init__(self) -> None:
+        self.node_id = uuid.uuid4().hex
+        self.handler: Optional[MessageHandler] = None
+        self.claimed: Set[str] = set()
+
+    async def start(self, handler: MessageHandler):
+        self.handler = handler
+
+    @abstractmethod
+    async def publish(self, doc_id: str, message: Dict):
+        """Send `message` to the other nodes. Raises BackplaneError, or the
+        transport's own error, when it was not sent."""
+
+    @abstractmethod
+    async def claim(self, doc_id: str) -> bool:
+        """Take or renew the claim on `doc_id`; False while another node holds it."""
+
+    async def release(self, doc_id: str):
+        self.claimed.discard(doc_id)
+
+    async def stop(self):
+        self.handler = None
+
+    def _encode(self, doc_id: str, message: Dict) -> str:
+        payload = json.dumps({"origin": self.node_id, "doc_id": doc_id, "message": message})
+        if len(payload) > MAX_MESSAGE_BYTES:
+            raise BackplaneError(f"{message.get('type')} message for document {doc_id} exceeds "
+                                 f"COLLAB_BACKPLANE_MAX_BYTES ({len(payload)} bytes)")
+        return payload
+
+    async def _dispatch(self, payload):
+        try:
+            envelope = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warning("Dropping malformed backplane payload")
+            return
+
+        if envelope.get("origin") == self.node_id or self.handler is None:
+            return
+
+        try:
+            await self.handler(envelope["doc_id"], envelope["message"])
+        except Exception as e:
+            logger.error(f"Error handling backplane message: {e}")
+
+
+class InProcessBackplane(Backplane):
+    """Default backplane. Managers sharing a hub list see each other's messages,
+    which is also how several "workers" are simulated inside one process."""
+
+    def __init__(self, hub: Optional[List["InProcessBackplane"]] = None) -> None:
+        super().__init__()
+        self.hub = hub if hub is not None else []
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        if self not in self.hub:
+            self.hub.append(self)
+
+    async def publish(self, doc_id: str, message: Dict):
+        payload = self._encode(doc_id, message)
+        for peer in list(self.hub):
+            if peer is not self:
+                await peer._dispatch(payload)
+
+    async def claim(self, doc_id: str) -> bool:
+        if any(doc_id in peer.claimed for peer in self.hub if peer is not self):
+            return False
+        self.claimed.add(doc_id)
+        return True
+
+    async def stop(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        self.claimed.clear()
+        await super().stop()
+
+
+class RedisBackplane(Backplane):
+    # Compare-and-set on the claim key, so a claim that expired and was
+    # taken by another node is never renewed or deleted by this one
+    RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end
+return 0
+"""
+    RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+    def __init__(self, url: str, channel: str = CHANNEL) -> None:
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("COLLAB_BACKPLANE=redis requires the 'redis' package") from e
+
+        self.channel = channel
+        self.client = redis.from_url(url)
+        self.pubsub = None
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        async for item in self.pubsub.listen():
+            await self._dispatch(item["data"])
+
+    async def publish(self, doc_id: str, message: Dict):
+        await self.client.publish(self.channel, self._encode(doc_id, message))
+
+    async def claim(self, doc_id: str) -> bool:
+        key = f"{self.channel}:sequencer:{doc_id}"
+        if not await self.client.set(key, self.node_id, nx=True, ex=CLAIM_TTL):
+            if not await self.client.eval(self.RENEW_SCRIPT, 1, key, self.node_id, CLAIM_TTL):
+                self.claimed.discard(doc_id)
+                return False
+        self.claimed.add(doc_id)
+        return True
+
+    async def release(self, doc_id: str):
+        if doc_id in self.claimed:
+            await self.client.eval(self.RELEASE_SCRIPT, 1, f"{self.channel}:sequencer:{doc_id}", self.node_id)
+        await super().release(doc_id)
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.pubsub:
+            await self.pubsub.unsubscribe(self.channel)
+            await self.pubsub.aclose()
+        await self.client.aclose()
+        await super().stop()
+
+
+class PostgresBackplane(Backplane):
+    """LISTEN/NOTIFY over a dedicated asyncpg connection.
+
+    NOTIFY payloads are capped at 8000 bytes by Postgres. Larger messages,
+    such as full-content updates of big notes, are split into base64 chunks
+    sent in one transaction; Postgres delivers a transaction's notifications
+    together and in order, and listeners reassemble them.
+
+    Claims are session advisory locks on the same connection, so they end
+    when the node's connection does.
+    """
+
+    MAX_PAYLOAD = 7999
+    CHUNK_BYTES = 5000  # 6668 characters in base64, plus the chunk header
+    CHUNK_PREFIX = "chunk:"
+    MAX_PENDING_CHUNKS = 64
+
+    def __init__(self, dsn: str, channel: str = CHANNEL) -> None:
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.connection = None
+        # asyncpg runs one query at a time per connection
+        self.lock = asyncio.Lock()
+        # Key: chunked message id, Value: base64 parts received so far
+        self.chunks: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    async def start(self, handler: MessageHandler):
+        import asyncpg
+
+        await super().start(handler)
+        self.connection = await asyncpg.connect(self.dsn)
+        await self.connection.add_listener(self.channel, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        payload = self._reassemble(payload)
+        if payload is not None:
+            asyncio.create_task(self._dispatch(payload))
+
+    def _reassemble(self, payload: str) -> Optional[str]:
+        """The whole payload once its last chunk arrives; None until then."""
+        if not payload.startswith(self.CHUNK_PREFIX):
+            return payload
+        _, origin, message_id, index, count, data = payload.split(":", 5)
+        if origin == self.node_id:
+            return None
+
+        parts = self.chunks.setdefault(message_id, [])
+        if int(index) != len(parts):
+            logger.warning("Dropping backplane message with missing chunks")
+            del self.chunks[message_id]
+            return None
+        parts.append(data)
+        if len(parts) < int(count):
+            while len(self.chunks) > self.MAX_PENDING_CHUNKS:
+                self.chunks.popitem(last=False)
+            return None
+        del self.chunks[message_id]
+        return b"".join(base64.b64decode(part) for part in parts).decode()
+
+    async def publish(self, doc_id: str, message: Dict):
+        payload = self._encode(doc_id, message)
+        data = payload.encode()
+        async with self.lock:
+            if len(data) <= self.MAX_PAYLOAD:
+                await self.connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                return
+
+            message_id = uuid.uuid4().hex
+            count = -(-len(data) // self.CHUNK_BYTES)
+            async with self.connection.transaction():
+                for index in range(count):
+                    part = base64.b64encode(data[index * self.CHUNK_BYTES:(index + 1) * self.CHUNK_BYTES]).decode()
+                    await self.connection.execute(
+                        "SELECT pg_notify($1, $2)", self.channel,
+                        f"{self.CHUNK_PREFIX}{self.node_id}:{message_id}:{index}:{count}:{part}",
+                    )
+
+    async def claim(self, doc_id: str) -> bool:
+        # Advisory locks are reentrant: take it once, then report the held claim
+        if doc_id in self.claimed:
+            return True
+        async with self.lock:
+            claimed = await self.connection.fetchval(
+                "SELECT pg_try_advisory_lock(hashtextextended($1, 0))", f"{self.channel}:{doc_id}")
+        if claimed:
+            self.claimed.add(doc_id)
+        return bool(claimed)
+
+    async def release(self, doc_id: str):
+        if doc_id in self.claimed:
+            async with self.lock:
+                await self.connection.execute(
+                    "SELECT pg_advisory_unlock(hashtextextended($1, 0))", f"{self.channel}:{doc_id}")
+        await super().release(doc_id)
+
+    async def stop(self):
+        if self.connection:
+            await self.connection.remove_listener(self.channel, self._on_notify)
+            await self.connection.close()
+        await super().stop()
+
+
+def backplane_is_shared() -> bool:
+    """Whether COLLAB_BACKPLANE reaches other processes."""
+    return config("COLLAB_BACKPLANE", default="memory") in ("redis", "postgres")
+
+
+def create_backplane(channel: str = CHANNEL) -> Backplane:
+    kind = config("COLLAB_BACKPLANE", default="memory")
+
+    if kind == "redis":
+        return RedisBackplane(config("REDIS_URL", default="redis://localhost:6379/0"), channel)
+
+    if kind == "postgres":
+        from app.db import DATABASE_URL
+        return PostgresBackplane(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"), channel)
+
+    return InProcessBackplane()
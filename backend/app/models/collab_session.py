@@ -0,0 +1,71 @@
+from typing import Any, Dict, Optional, Set
+from collections import deque
+from fastapi import WebSocket
+import asyncio
+import time
+
+
+class Cursor:
+    __slots__ = ("user_id", "user_name", "color", "position", "timestamp")
+
+    def __init__(self, user_id: str, user_name: str, color: str) -> None:
+        self.user_id = user_id
+        self.user_name = user_name
+        self.color = color
+        self.position: Any = None
+        self.timestamp = 0.0
+
+    def to_message(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "position": self.position,
+            "color": self.color
+        }
+
+
+class Connection:
+    """One collaborator socket and its outbound queue."""
+
+    __slots__ = ("websocket", "session", "user_id", "user_name", "color", "codec", "can_edit",
+                 "connected_at", "last_seen", "queue", "writer")
+
+    def __init__(self, websocket: WebSocket, session: "DocumentSession", user_id: str,
+                 user_name: str, color: str, codec, can_edit: bool = True) -> None:
+        self.websocket = websocket
+        self.session = session
+        self.user_id = user_id
+        self.user_name = user_name
+        self.color = color
+        self.codec = codec
+        self.can_edit = can_edit  # False for view-only grants: cursors but no edits
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at  # Last inbound frame, pongs included
+        self.queue: Optional[asyncio.Queue] = None
+        self.writer: Optional[asyncio.Task] = None
+
+
+class DocumentSession:
+    """Live state of one document on this worker: who is connected, the
+    current content/revision, recent op history and cursors."""
+
+    __slots__ = ("doc_id", "connections", "content", "revision", "history", "cursors", "moved_cursors",
+                 "sequencer", "sync_buffer")
+
+    def __init__(self, doc_id: str, history_size: int) -> None:
+        self.doc_id = doc_id
+        self.connections: Set[Connection] = set()
+        self.content: Optional[str] = None  # None until loaded
+        self.revision = 0
+        self.history: deque = deque(maxlen=history_size)  # (revision, ops) of the latest revisions
+        self.cursors: Dict[str, Cursor] = {}  # Key: user_id
+        self.moved_cursors: Set[str] = set()  # Moved since the last cursor tick
+        self.sequencer = False  # Whether this worker holds the document's claim
+        # Committed messages received while waiting for a sync; None when in step
+        self.sync_buffer: Optional[deque] = None
+
+    def replace_content(self, content: str, revision: int):
+        self.content = content
+        self.revision = revision
+        # A full replace cannot be transformed against, so older ops must resync
+        self.history.clear()
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from decouple import config
+from sqlalchemy.future import select
+import asyncio
+import logging
+
+from app.db import AsyncSessionLocal
+from app.models.document_flusher import DocumentFlusher
+from app.models.models import Document
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_BYTES = int(config("COLLAB_CACHE_MAX_BYTES", default=str(64 * 1024 * 1024)))
+
+
+class DocumentCache:
+    """Bounded LRU of hot document contents, sized by content length.
+
+    Each entry carries the updated_at of the row it was read from or
+    written as. A cached copy is only used after a primary-key lookup shows
+    the row still has that updated_at, so writes made through another
+    worker are never served stale; the check costs a round trip but not
+    the content. Misses are loaded from the database; concurrent loads of
+    the same document share a single query.
+
+    The timestamp cannot show a write-behind flush that has not committed:
+    the row and the cached copy still agree while it runs. Loads therefore
+    settle the document with every flusher registered by `add_writer`
+    first.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, session_factory=AsyncSessionLocal) -> None:
+        self.max_bytes = max_bytes
+        self.session_factory = session_factory
+        self.entries: "OrderedDict[str, Tuple[datetime, str]]" = OrderedDict()  # Value: (updated_at, content)
+        self.size = 0
+        self.loading: Dict[str, asyncio.Future] = {}
+        self.writers: List[DocumentFlusher] = []
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, doc_id: str) -> Optional[Tuple[datetime, str]]:
+        entry = self.entries.get(doc_id)
+        if entry is not None:
+            self.entries.move_to_end(doc_id)
+        return entry
+
+    def put(self, doc_id: str, content: str, updated_at: datetime):
+        self.invalidate(doc_id)
+        if len(content) > self.max_bytes:
+            return
+
+        self.entries[doc_id] = (updated_at, content)
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def add_writer(self, flusher: DocumentFlusher):
+        if flusher not in self.writers:
+            self.writers.append(flusher)
+
+    def remove_writer(self, flusher: DocumentFlusher):
+        if flusher in self.writers:
+            self.writers.remove(flusher)
+
+    def invalidate(self, doc_id: str):
+        entry = self.entries.pop(doc_id, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    async def load(self, doc_id: str) -> Optional[str]:
+        if doc_id in self.loading:
+            return await asyncio.shield(self.loading[doc_id])
+
+        future = asyncio.get_running_loop().create_future()
+        self.loading[doc_id] = future
+        try:
+            content = await self._load(doc_id)
+            future.set_result(content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Joiners waiting on this load re-raise it; don't warn if there are none
+            raise
+        finally:
+            self.loading.pop(doc_id, None)
+
+    async def _load(self, doc_id: str) -> Optional[str]:
+        for writer in list(self.writers):
+            unsaved = await writer.settle(doc_id)
+            if unsaved is not None:
+                return unsaved  # The write failed; the row is behind this content
+
+        async with self.session_factory() as session:
+            cached = self.get(doc_id)
+            if cached is not None:
+                result = await session.execute(select(Document.updated_at).where(Document.doc_id == doc_id))
+                if result.scalar_one_or_none() == cached[0]:
+                    self.hits += 1
+                    return cached[1]
+                self.stale += 1
+                self.invalidate(doc_id)
+
+            self.misses += 1
+            result = await session.execute(
+                select(Document.content, Document.updated_at).where(Document.doc_id == doc_id)
+            )
+            row = result.first()
+        if row is None:
+            return None
+        content = row.content or ""
+        self.put(doc_id, content, row.updated_at)
+        return content
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+        }
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from decouple import config
+from sqlalchemy import bindparam, update
+import asyncio
+import logging
+
+from app.db import AsyncSessionLocal
+from app.models.inverted_index import search_index
+from app.models.models import Document
+from app.models.revision_store import record_revisions
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(config("COLLAB_FLUSH_INTERVAL", default="2"))
+FLUSH_BATCH_SIZE = int(config("COLLAB_FLUSH_BATCH_SIZE", default="100"))
+# Documents whose last recorded revision is kept as the base of the next delta
+FLUSH_RECORDED_MAX_ENTRIES = int(config("COLLAB_FLUSH_RECORDED_MAX_ENTRIES", default="1000"))
+
+
+FLUSH_STATEMENT = (
+    update(Document.__table__)
+    .where(Document.__table__.c.doc_id == bindparam("b_doc_id"))
+    .values(content=bindparam("b_content"), updated_at=bindparam("b_updated_at"))
+)
+
+
+class DocumentFlusher:
+    """Write-behind persistence for live document content.
+
+    Edits only mark a document dirty; repeated edits to the same document
+    between flushes coalesce into one row. Dirty documents are written with a
+    single batched UPDATE every `interval` seconds, as soon as `batch_size`
+    documents are pending, or on demand (last disconnect, shutdown). Their
+    revisions are recorded in the same transaction, with one query and one
+    INSERT for the batch.
+
+    Until that transaction commits the database still holds the old row;
+    readers must take `unsaved` content first, or `settle` the document.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = FLUSH_INTERVAL,
+                 batch_size: int = FLUSH_BATCH_SIZE, recorded_max_entries: int = FLUSH_RECORDED_MAX_ENTRIES) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.recorded_max_entries = recorded_max_entries
+        self.dirty: Dict[str, str] = {}  # Key: docid, Value: latest unsaved content
+        self.writing: Dict[str, str] = {}  # The batch being written, until it commits or is requeued
+        # Key: docid, Value: (revision, content) this flusher last recorded
+        self.recorded: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    def mark_dirty(self, doc_id: str, content: str):
+        self.dirty[doc_id] = content
+        if len(self.dirty) >= self.batch_size:
+            self.wakeup.set()
+
+    def unsaved(self, doc_id: str) -> Optional[str]:
+        """The latest content of `doc_id` not committed yet, pending or being written."""
+        if doc_id in self.dirty:
+            return self.dirty[doc_id]
+        return self.writing.get(doc_id)
+
+    async def settle(self, doc_id: str) -> Optional[str]:
+        """Write the unsaved content of `doc_id` and wait for it to commit.
+        Returns the content still unsaved afterwards, if the write failed."""
+        if self.unsaved(doc_id) is not None:
+            # Taking the lock also waits out a batch already being written
+            await self.flush([doc_id])
+        return self.unsaved(doc_id)
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self, doc_ids: Optional[Iterable[str]] = None) -> Dict[str, datetime]:
+        """Write the dirty documents among `doc_ids`, or all of them.
+        Returns the updated_at written for each document saved."""
+        if doc_ids is None:
+            doc_ids = list(self.dirty)
+
+        async with self.lock:
+            batch = {doc_id: self.dirty.pop(doc_id) for doc_id in doc_ids if doc_id in self.dirty}
+            if not batch:
+                return {}
+            self.writing = batch
+            try:
+                return await self._write(batch)
+            finally:
+                self.writing = {}
+
+    async def _write(self, batch: Dict[str, str]) -> Dict[str, datetime]:
+        now = datetime.now()
+        rows = [
+            {"b_doc_id": doc_id, "b_content": content, "b_updated_at": now}
+            for doc_id, content in batch.items()
+        ]
+        try:
+            async with self.session_factory() as session:
+                # One executemany round trip for the whole batch
+                await session.execute(FLUSH_STATEMENT, rows)
+                revisions = await record_revisions(session, batch, self.recorded)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error flushing {len(rows)} documents: {e}")
+            # Requeue, unless a newer edit arrived while we were writing
+            for doc_id, content in batch.items():
+                self.dirty.setdefault(doc_id, content)
+            return {}
+
+        for doc_id, revision in revisions.items():
+            self.recorded[doc_id] = (revision, batch[doc_id] or "")
+            self.recorded.move_to_end(doc_id)
+        while len(self.recorded) > self.recorded_max_entries:
+            self.recorded.popitem(last=False)
+        for doc_id, content in batch.items():
+            search_index.update(doc_id, content)
+        logger.info(f"Flushed {len(rows)} documents")
+        return {doc_id: now for doc_id in batch}
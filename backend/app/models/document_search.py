@@ -0,0 +1,104 @@
+from typing import Dict, List
+from sqlalchemy import func, literal_column, or_
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.document_text import START_MARK, STOP_MARK
+from app.models.inverted_index import highlight, search_index
+from app.models.models import AccessDocument, Document
+
+# Text search configuration of the generated documents.search_vector column.
+# The column is defined in migration e3a9c5d27b64; changing this needs a new
+# migration that regenerates it with the same configuration.
+SEARCH_CONFIG = "english"
+REGCONFIG = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+
+# Not mapped on Document: it only exists on Postgres, and mapping it would
+# load every note's lexemes with each row
+SEARCH_VECTOR = literal_column("documents.search_vector", TSVECTOR)
+
+# Matches are marked with private use characters, turned into <mark> tags by
+# marked_html once the snippet has been escaped
+HEADLINE_OPTIONS = f"StartSel={START_MARK}, StopSel={STOP_MARK}, MaxWords=30, MinWords=10, MaxFragments=2"
+
+
+def visible_documents(user_id: int):
+    """Documents owned by or shared with `user_id`."""
+    return or_(
+        Document.user_id == user_id,
+        Document.doc_id.in_(select(AccessDocument.doc_id).where(AccessDocument.user_id == user_id)),
+    )
+
+
+def search_documents_query(user_id: int, text: str, limit: int, offset: int = 0):
+    """Documents owned by or shared with `user_id` that match `text`, best
+    first, with a highlighted snippet of the content.
+
+    `text` uses web search syntax: quoted phrases, OR, and -word. Matches
+    come from the GIN index on search_vector. Title hits are weighted above
+    content hits. Snippets are only built for the rows on the page, because
+    ts_headline re-parses the whole note. Both the vector and the snippet
+    use the note's text, not its Delta JSON. Snippets come back with
+    matches between START_MARK and STOP_MARK; pass them through
+    marked_html before returning them.
+    """
+    query = func.websearch_to_tsquery(REGCONFIG, text)
+    rank = func.ts_rank_cd(SEARCH_VECTOR, query).label("rank")
+
+    hits = (
+        select(Document.doc_id, rank)
+        .where(SEARCH_VECTOR.op("@@")(query), visible_documents(user_id))
+        .order_by(rank.desc(), Document.doc_id)
+        .limit(limit)
+        .offset(offset)
+        .subquery("hits")
+    )
+
+    snippet = func.ts_headline(REGCONFIG, func.document_text(Document.content), query, HEADLINE_OPTIONS)
+    return (
+        select(
+            Document.doc_id,
+            Document.doc_name,
+            Document.directory_id,
+            Document.is_stared,
+            Document.user_id,
+            Document.created_at,
+            Document.updated_at,
+            hits.c.rank,
+            snippet.label("snippet"),
+        )
+        .join(hits, hits.c.doc_id == Document.doc_id)
+        .order_by(hits.c.rank.desc(), Document.doc_id)
+    )
+
+
+async def search_documents_indexed(db: AsyncSession, user_id: int, text: str, limit: int,
+                                   offset: int = 0) -> List[Dict]:
+    """search_documents_query for SEARCH_BACKEND=index, answered from the
+    in-process inverted index. Returns rows of the same shape."""
+    result = await db.execute(select(Document.doc_id).where(visible_documents(user_id)))
+    await search_index.ensure_loaded()
+    ranked = search_index.search(text, set(result.scalars().all()), limit, offset)
+    if not ranked:
+        return []
+
+    result = await db.execute(select(Document).where(Document.doc_id.in_([doc_id for doc_id, _ in ranked])))
+    documents = {document.doc_id: document for document in result.scalars().all()}
+    hits = []
+    for doc_id, rank in ranked:
+        document = documents.get(doc_id)
+        if document is None:
+            continue  # Deleted since it was ranked
+        hits.append({
+            "doc_id": document.doc_id,
+            "doc_name": document.doc_name,
+            "directory_id": document.directory_id,
+            "is_stared": document.is_stared,
+            "user_id": document.user_id,
+            "created_at": document.created_at,
+            "updated_at": document.updated_at,
+            "rank": rank,
+            "snippet": highlight(document.content or "", text),
+        })
+    return hits
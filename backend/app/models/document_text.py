@@ -0,0 +1,44 @@
+from typing import Optional
+import html
+import json
+
+# Wrap matches in search snippets until the text has been escaped. Private
+# use characters, removed from document text so a note cannot forge them.
+START_MARK = "\ue000"
+STOP_MARK = "\ue001"
+MARKS = str.maketrans("", "", START_MARK + STOP_MARK)
+
+
+def document_text(content: Optional[str]) -> str:
+    """The words of a document, for indexing and snippets.
+
+    The editor stores a Quill Delta, {"ops": [{"insert": "text", ...}]};
+    its inserted strings are joined and embeds become a space, so JSON keys
+    like "ops" or "insert" never match. Content that is not a Delta is used
+    as it is. Kept in step with the document_text SQL function from
+    migration e3a9c5d27b64, whose ltrim only strips spaces.
+    """
+    if not content:
+        return ""
+    if content.lstrip(" ").startswith("{"):
+        try:
+            delta = json.loads(content)
+        except ValueError:
+            delta = None
+        ops = delta.get("ops") if isinstance(delta, dict) else None
+        if isinstance(ops, list):
+            parts = []
+            for op in ops:
+                insert = op.get("insert") if isinstance(op, dict) else None
+                if isinstance(insert, str):
+                    parts.append(insert)
+                elif insert is not None:
+                    parts.append(" ")
+            content = "".join(parts)
+    return content.translate(MARKS)
+
+
+def marked_html(snippet: str) -> str:
+    """HTML for a snippet whose matches are wrapped in START_MARK and
+    STOP_MARK: the text is escaped, then the marks become <mark> tags."""
+    return html.escape(snippet).replace(START_MARK, "<mark>").replace(STOP_MARK, "</mark>")
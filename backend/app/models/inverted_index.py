@@ -0,0 +1,611 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from decouple import config
+from sqlalchemy.future import select
+import asyncio
+import gc
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+from app.db import AsyncSessionLocal
+from app.models.document_text import START_MARK, STOP_MARK, document_text, marked_html
+from app.models.models import Document
+
+logger = logging.getLogger(__name__)
+
+# "postgres" searches with the tsvector column; "index" uses this module
+SEARCH_BACKEND = config("SEARCH_BACKEND", default="postgres")
+SEARCH_INDEX_PATH = config("SEARCH_INDEX_PATH", default="search-index.bin")
+# Writes made through other workers show up in searches after at most this long
+SEARCH_INDEX_REFRESH = timedelta(seconds=float(config("SEARCH_INDEX_REFRESH", default="5")))
+
+# Rows changed this close before a segment was built or the index was last
+# refreshed are re-read, in case their transaction committed late
+CATCH_UP_MARGIN = timedelta(seconds=60)
+MAX_PREFIX_EXPANSIONS = 64
+
+TOKEN = re.compile(r"\w+")
+QUERY_CLAUSE = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+
+
+class Clause(NamedTuple):
+    kind: str  # "term", "prefix" or "phrase"
+    terms: Tuple[str, ...]
+    negated: bool
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def parse_query(text: str) -> List[Clause]:
+    """Split a query into clauses, all of which must match.
+
+    `word` is a term, `wor*` a prefix, `"two words"` a phrase, and a leading
+    `-` excludes documents matching the clause.
+    """
+    clauses = []
+    for match in QUERY_CLAUSE.finditer(text):
+        if match.group(2) is not None:
+            negated, words, prefix = bool(match.group(1)), match.group(2), False
+        else:
+            negated, words = bool(match.group(3)), match.group(4)
+            prefix = words.endswith("*")
+
+        terms = tuple(tokenize(words))
+        if not terms:
+            continue
+        if len(terms) > 1:
+            clauses.append(Clause("phrase", terms, negated))
+        elif prefix:
+            clauses.append(Clause("prefix", terms, negated))
+        else:
+            clauses.append(Clause("term", terms, negated))
+    return clauses
+
+
+HEADER = struct.Struct("<4sIdIIQ")  # magic, version, built_at, docs, terms, total length
+MAGIC = b"SNIX"
+VERSION = 3  # 3: document_text only skips leading spaces before a Delta, like the SQL function
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+TERM_ENTRY = struct.Struct("<IQ")  # document frequency, postings offset
+POSTING = struct.Struct("<II")  # document ordinal, term frequency
+
+
+def _positions(data: bytes) -> array:
+    positions = array("I", data)
+    if sys.byteorder == "big":
+        positions.byteswap()
+    return positions
+
+
+def _little_endian(positions: array) -> bytes:
+    if sys.byteorder == "big":
+        positions = array("I", positions)
+        positions.byteswap()
+    return positions.tobytes()
+
+
+class Segment:
+    """Immutable postings written by InvertedIndex.save and read through mmap.
+
+    Layout: header, document table (id, length), sorted term directory,
+    then per term its postings as (ordinal, tf, positions...) in uint32s.
+    Only the two tables are parsed on open; postings are decoded from the
+    mapping when a query touches them.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise
+        try:
+            self._parse(path)
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def _parse(self, path: str):
+        magic, version, built_at, doc_count, term_count, self.total_length = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} search index segment")
+        self.built_at = datetime.fromtimestamp(built_at)
+
+        offset = HEADER.size
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        for _ in range(doc_count):
+            (size,) = U16.unpack_from(self.map, offset)
+            self.doc_ids.append(self.map[offset + 2:offset + 2 + size].decode())
+            (length,) = U32.unpack_from(self.map, offset + 2 + size)
+            self.doc_lengths.append(length)
+            offset += 6 + size
+        self.ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(self.doc_ids)}
+
+        self.terms: List[str] = []
+        self.term_entries: Dict[str, Tuple[int, int]] = {}
+        for _ in range(term_count):
+            (size,) = U16.unpack_from(self.map, offset)
+            term = self.map[offset + 2:offset + 2 + size].decode()
+            self.terms.append(term)
+            self.term_entries[term] = TERM_ENTRY.unpack_from(self.map, offset + 2 + size)
+            offset += 2 + size + TERM_ENTRY.size
+        self.postings_start = offset
+
+    def df(self, term: str) -> int:
+        entry = self.term_entries.get(term)
+        return entry[0] if entry else 0
+
+    def postings(self, term: str) -> Iterator[Tuple[int, array]]:
+        entry = self.term_entries.get(term)
+        if entry is None:
+            return
+        df, offset = entry
+        offset += self.postings_start
+        for _ in range(df):
+            ordinal, tf = POSTING.unpack_from(self.map, offset)
+            offset += POSTING.size
+            yield ordinal, _positions(self.map[offset:offset + 4 * tf])
+            offset += 4 * tf
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def write_segment(path: str, built_at: datetime, docs: Sequence[Tuple[str, int]],
+                  postings: Dict[str, List[Tuple[int, array]]]):
+    """Write a segment atomically: to a temporary file, then renamed over `path`.
+
+    Each writer gets its own temporary file, so workers saving at the same
+    time cannot interleave; the last rename wins with a complete segment.
+    """
+    terms = sorted(postings)
+    blob = bytearray()
+    directory = bytearray()
+    for term in terms:
+        entries = postings[term]
+        encoded = term.encode()
+        directory += U16.pack(len(encoded)) + encoded + TERM_ENTRY.pack(len(entries), len(blob))
+        for ordinal, positions in entries:
+            blob += POSTING.pack(ordinal, len(positions))
+            blob += _little_endian(positions)
+
+    directory_path, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory_path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, built_at.timestamp(), len(docs), len(terms),
+                                sum(length for _, length in docs)))
+            for doc_id, length in docs:
+                encoded = doc_id.encode()
+                f.write(U16.pack(len(encoded)) + encoded + U32.pack(length))
+            f.write(directory)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class InvertedIndex:
+    """Pure-Python full-text index over document content with BM25 ranking.
+
+    The index has two layers. The memory-mapped segment from the last
+    `save` is read-only. A memory layer holds documents added or changed
+    since then, and their segment copies are masked as deleted. Write paths
+    call `update` or `remove`, which re-tokenize a single document. `save`
+    merges both layers into a new segment.
+
+    On first use a worker opens the saved segment and re-reads only the
+    documents changed since it was built, so it does not re-index
+    everything. Each worker has its own index and applies its own writes
+    at once; before a search it re-reads documents whose updated_at moved
+    since its last refresh, so writes through other workers appear within
+    SEARCH_INDEX_REFRESH. Documents deleted elsewhere keep their postings
+    until the next load, but are never returned because results are
+    limited to documents the database lists as visible. Document
+    frequencies include masked segment postings until the next save,
+    which skews rankings slightly.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH, session_factory=AsyncSessionLocal,
+                 enabled: bool = SEARCH_BACKEND == "index") -> None:
+        self.path = path
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.segment: Optional[Segment] = None
+        self.deleted: Set[int] = set()  # Segment ordinals superseded since it was written
+        self.postings: Dict[str, Dict[str, array]] = {}  # Key: term, then doc_id
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.sorted_terms: Optional[List[str]] = None  # Memory-layer terms, rebuilt on demand
+        self.doc_count = 0
+        self.total_length = 0
+        self.built_at: Optional[datetime] = None
+        self.loaded = False
+        self.loading = False
+        self.pending: Dict[str, Optional[str]] = {}  # Writes seen while loading; None removes
+        self.lock = asyncio.Lock()
+
+    # Maintenance
+
+    def update(self, doc_id: str, content: Optional[str]):
+        if not self.enabled:
+            return
+        if self.loading:
+            self.pending[doc_id] = content or ""
+        elif self.loaded:
+            self._discard(doc_id)
+            self._add(doc_id, content or "")
+
+    def remove(self, doc_id: str):
+        if not self.enabled:
+            return
+        if self.loading:
+            self.pending[doc_id] = None
+        elif self.loaded:
+            self._discard(doc_id)
+
+    def _add(self, doc_id: str, content: str):
+        positions: Dict[str, List[int]] = {}
+        tokens = tokenize(document_text(content))
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+
+        for term, term_positions in positions.items():
+            docs = self.postings.get(term)
+            if docs is None:
+                docs = self.postings[term] = {}
+                self.sorted_terms = None
+            # Arrays are not tracked by the garbage collector, unlike tuples of ints
+            docs[doc_id] = array("I", term_positions)
+        self.doc_terms[doc_id] = tuple(positions)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_count += 1
+        self.total_length += len(tokens)
+
+    def _discard(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is not None:
+            for term in terms:
+                docs = self.postings[term]
+                del docs[doc_id]
+                if not docs:
+                    del self.postings[term]
+                    self.sorted_terms = None
+            self.doc_count -= 1
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            return
+
+        ordinal = self.segment.ordinals.get(doc_id) if self.segment else None
+        if ordinal is not None and ordinal not in self.deleted:
+            self.deleted.add(ordinal)
+            self.doc_count -= 1
+            self.total_length -= self.segment.doc_lengths[ordinal]
+
+    def doc_ids(self) -> Set[str]:
+        live = set(self.doc_terms)
+        if self.segment:
+            live.update(doc_id for ordinal, doc_id in enumerate(self.segment.doc_ids) if ordinal not in self.deleted)
+        return live
+
+    # Loading and persistence
+
+    async def ensure_loaded(self):
+        """Load the index on first use, and refresh it from the database when
+        SEARCH_INDEX_REFRESH has passed. Callers search right after this
+        returns, without awaiting in between: the layers are only mutated off
+        the event loop while `lock` is held."""
+        if not self.enabled:
+            return
+        async with self.lock:
+            if not self.loaded:
+                await self._load()
+            elif datetime.now() - self.built_at >= SEARCH_INDEX_REFRESH:
+                await self._refresh()
+
+    async def _load(self):
+        # Tokenizing, merging and parsing the segment run on a thread so the
+        # event loop keeps serving; writes seen meanwhile wait in `pending`
+        started = datetime.now()
+        self.loading = True
+        try:
+            segment = await asyncio.to_thread(self._open_segment)
+            if segment is not None:
+                self.segment = segment
+                self.doc_count = len(segment.doc_ids)
+                self.total_length = segment.total_length
+                await self._catch_up(segment.built_at - CATCH_UP_MARGIN)
+            else:
+                await self._build()
+                self.built_at = started
+                await asyncio.to_thread(self.save)
+        finally:
+            self.loading = False
+
+        self._apply_pending()
+        self.built_at = started
+        self.loaded = True
+        logger.info(f"Search index ready with {self.doc_count} documents")
+
+    async def _refresh(self):
+        started = datetime.now()
+        self.loading = True
+        try:
+            async with self.session_factory() as session:
+                await self._reindex_changed(session, self.built_at - CATCH_UP_MARGIN)
+        finally:
+            self.loading = False
+            self._apply_pending()
+        self.built_at = started
+
+    def _apply_pending(self):
+        for doc_id, content in self.pending.items():
+            self._discard(doc_id)
+            if content is not None:
+                self._add(doc_id, content)
+        self.pending.clear()
+
+    def _open_segment(self) -> Optional[Segment]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            return Segment(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable search index {self.path}: {e}")
+            return None
+
+    def _add_rows(self, rows):
+        for row in rows:
+            self._discard(row.doc_id)
+            self._add(row.doc_id, row.content or "")
+
+    async def _build(self):
+        async with self.session_factory() as session:
+            result = await session.stream(
+                select(Document.doc_id, Document.content).execution_options(yield_per=500)
+            )
+            async for rows in result.partitions():
+                await asyncio.to_thread(self._add_rows, rows)
+
+    async def _catch_up(self, since: datetime):
+        async with self.session_factory() as session:
+            result = await session.execute(select(Document.doc_id))
+            current = set(result.scalars().all())
+            indexed = self.doc_ids()
+            for doc_id in indexed - current:
+                self._discard(doc_id)
+
+            missing = list(current - indexed - await self._reindex_changed(session, since))
+            for start in range(0, len(missing), 500):
+                result = await session.execute(
+                    select(Document.doc_id, Document.content).where(Document.doc_id.in_(missing[start:start + 500]))
+                )
+                await asyncio.to_thread(self._add_rows, result.all())
+
+    async def _reindex_changed(self, session, since: datetime) -> Set[str]:
+        """Re-read documents updated at or after `since`; returns their ids."""
+        seen = set()
+        result = await session.stream(
+            select(Document.doc_id, Document.content)
+            .where(Document.updated_at >= since)
+            .execution_options(yield_per=500)
+        )
+        async for rows in result.partitions():
+            await asyncio.to_thread(self._add_rows, rows)
+            seen.update(row.doc_id for row in rows)
+        return seen
+
+    def save(self):
+        """Merge both layers into a new segment at `path` and reopen it.
+
+        Takes seconds on a large index, so it runs on a thread while `lock`
+        is held and writes are queued.
+        """
+        # The merge allocates a tuple per posting; collector passes over
+        # millions of them would otherwise dominate the run time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._merge()
+        finally:
+            if collecting:
+                gc.enable()
+
+        self.deleted.clear()
+        self.postings.clear()
+        self.doc_terms.clear()
+        self.doc_lengths.clear()
+        self.sorted_terms = None
+
+    def _merge(self):
+        docs: List[Tuple[str, int]] = []
+        postings: Dict[str, List[Tuple[int, array]]] = {}
+        if self.segment:
+            remap = {}
+            for ordinal, doc_id in enumerate(self.segment.doc_ids):
+                if ordinal not in self.deleted:
+                    remap[ordinal] = len(docs)
+                    docs.append((doc_id, self.segment.doc_lengths[ordinal]))
+            for term in self.segment.terms:
+                entries = [(remap[ordinal], positions) for ordinal, positions in self.segment.postings(term)
+                           if ordinal in remap]
+                if entries:
+                    postings[term] = entries
+
+        ordinals = {}
+        for doc_id, length in self.doc_lengths.items():
+            ordinals[doc_id] = len(docs)
+            docs.append((doc_id, length))
+        for term, term_docs in self.postings.items():
+            postings.setdefault(term, []).extend((ordinals[doc_id], positions) for doc_id, positions in term_docs.items())
+
+        write_segment(self.path, self.built_at or datetime.now(), docs, postings)
+        if self.segment:
+            self.segment.close()
+        self.segment = Segment(self.path)
+
+    async def close(self):
+        async with self.lock:
+            # Writes from here on are already in the database; the next
+            # worker to load the index catches up on them
+            self.loading = True
+            try:
+                if self.loaded:
+                    await asyncio.to_thread(self.save)
+            finally:
+                if self.segment:
+                    self.segment.close()
+                    self.segment = None
+                self.loaded = False
+                self.loading = False
+                self.pending.clear()
+
+    # Querying
+
+    def search(self, text: str, allowed: Optional[Set[str]] = None, limit: int = 20,
+               offset: int = 0) -> List[Tuple[str, float]]:
+        """(doc_id, score) pairs matching every clause of `text`, best first.
+        `allowed` restricts matches to those documents."""
+        clauses = parse_query(text)
+        if not any(not clause.negated for clause in clauses) or not self.doc_count:
+            return []
+
+        scores: Optional[Dict[str, float]] = None
+        excluded: Set[str] = set()
+        for clause in sorted(clauses, key=lambda clause: clause.negated):
+            matched = self._match(clause, allowed if scores is None else scores.keys())
+            if clause.negated:
+                excluded.update(matched)
+            elif scores is None:
+                scores = matched
+            else:
+                scores = {doc_id: score + matched[doc_id] for doc_id, score in scores.items() if doc_id in matched}
+            if not scores:
+                return []
+
+        ranked = sorted(
+            ((doc_id, score) for doc_id, score in scores.items() if doc_id not in excluded),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return ranked[offset:offset + limit]
+
+    def _match(self, clause: Clause, allowed) -> Dict[str, float]:
+        if clause.kind == "term":
+            return self._score_term(clause.terms[0], allowed)
+
+        if clause.kind == "prefix":
+            best: Dict[str, float] = {}
+            for term in self.expand(clause.terms[0]):
+                for doc_id, score in self._score_term(term, allowed).items():
+                    if score > best.get(doc_id, 0.0):
+                        best[doc_id] = score
+            return best
+
+        # Phrase: every term at consecutive positions
+        term_postings = [self._postings(term, allowed) for term in clause.terms]
+        candidates = set.intersection(*(set(docs) for docs in term_postings))
+        scores = {}
+        for doc_id in candidates:
+            first, length = term_postings[0][doc_id]
+            later = [set(docs[doc_id][0]) for docs in term_postings[1:]]
+            count = sum(1 for p in first if all(p + i + 1 in positions for i, positions in enumerate(later)))
+            if count:
+                scores[doc_id] = sum(self._bm25(count, length, self._df(term)) for term in clause.terms)
+        return scores
+
+    def _score_term(self, term: str, allowed) -> Dict[str, float]:
+        df = self._df(term)
+        return {
+            doc_id: self._bm25(len(positions), length, df)
+            for doc_id, (positions, length) in self._postings(term, allowed).items()
+        }
+
+    def _postings(self, term: str, allowed) -> Dict[str, Tuple[Sequence[int], int]]:
+        """doc_id -> (positions, document length) across both layers."""
+        found = {}
+        if self.segment:
+            for ordinal, positions in self.segment.postings(term):
+                if ordinal in self.deleted:
+                    continue
+                doc_id = self.segment.doc_ids[ordinal]
+                if allowed is None or doc_id in allowed:
+                    found[doc_id] = (positions, self.segment.doc_lengths[ordinal])
+        for doc_id, positions in self.postings.get(term, {}).items():
+            if allowed is None or doc_id in allowed:
+                found[doc_id] = (positions, self.doc_lengths[doc_id])
+        return found
+
+    def _df(self, term: str) -> int:
+        df = len(self.postings.get(term, ()))
+        if self.segment:
+            df += self.segment.df(term)
+        return df
+
+    def _bm25(self, tf: int, length: int, df: int) -> float:
+        idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+        average = self.total_length / self.doc_count if self.doc_count else 1.0
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / (average or 1.0)))
+
+    def expand(self, prefix: str) -> List[str]:
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+        sources = [self.sorted_terms] + ([self.segment.terms] if self.segment else [])
+
+        terms = set()
+        for source in sources:
+            index = bisect_left(source, prefix)
+            while index < len(source) and source[index].startswith(prefix) and len(terms) < MAX_PREFIX_EXPANSIONS:
+                terms.add(source[index])
+                index += 1
+        return sorted(terms)
+
+
+def highlight(content: str, text: str, words: int = 30) -> str:
+    """A window of about `words` words of the document's text around the
+    first match of `text`, HTML-escaped, with matched words wrapped in
+    <mark> like the Postgres snippets."""
+    clauses = [clause for clause in parse_query(text) if not clause.negated]
+    terms = {term for clause in clauses if clause.kind != "prefix" for term in clause.terms}
+    prefixes = tuple(clause.terms[0] for clause in clauses if clause.kind == "prefix")
+
+    def matches(token: str) -> bool:
+        token = token.lower()
+        return token in terms or (bool(prefixes) and token.startswith(prefixes))
+
+    content = document_text(content)
+    tokens = list(TOKEN.finditer(content))
+    if not tokens:
+        return ""
+    first = next((i for i, token in enumerate(tokens) if matches(token.group())), 0)
+    start = max(0, first - words // 3)
+    end = min(len(tokens), start + words)
+
+    parts = []
+    cursor = tokens[start].start()
+    for token in tokens[start:end]:
+        parts.append(content[cursor:token.start()])
+        parts.append(f"{START_MARK}{token.group()}{STOP_MARK}" if matches(token.group()) else token.group())
+        cursor = token.end()
+    return ("..." if start else "") + marked_html("".join(parts)) + ("..." if end < len(tokens) else "")
+
+
+search_index = InvertedIndex()
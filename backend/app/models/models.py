@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, UniqueConstraint,CheckConstraint, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, UniqueConstraint,CheckConstraint, Enum, Index, text
 from app.db import Base
 from sqlalchemy.orm import relationship 
 from datetime import datetime
@@ -29,8 +29,8 @@ class Directory(Base):
     dir_id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     dir_name = Column(String(50), nullable=False)
     is_stared = Column(Boolean, nullable=False,default=False)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     user_id = Column(Integer, ForeignKey('users.user_id',ondelete="CASCADE"), nullable=False)
     parent_id = Column(String(36), ForeignKey("directories.dir_id",ondelete="CASCADE"), nullable=True)
     color = Column(String(7), default="#99e810")
@@ -43,6 +43,12 @@ class Directory(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "dir_name", name="unique_user_dir_name"),
+        # Listing pages, newest first
+        Index("ix_directories_user_updated", "user_id", "updated_at", "dir_id"),
+        Index("ix_directories_user_starred", "user_id", "updated_at", "dir_id",
+              postgresql_where=text("is_stared")),
+        # Tree recursion, top-level lookups and cascading deletes
+        Index("ix_directories_parent_id", "parent_id"),
     )
     def __repr__(self):
         return f"<Directory(id={self.dir_id}, name={self.dir_name}, user_id={self.user_id})>"
@@ -55,8 +61,8 @@ class Document(Base):
     doc_name = Column(String(50), nullable=False)
     content = Column(Text, nullable=True)
     is_stared = Column(Boolean, nullable=False, default=False)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     user_id = Column(Integer, ForeignKey("users.user_id",ondelete="CASCADE"), nullable=False)
     directory_id = Column(String(36), ForeignKey("directories.dir_id",ondelete="CASCADE"), nullable=False)
     
@@ -65,10 +71,34 @@ class Document(Base):
 
     __table_args__ = (
         UniqueConstraint('user_id', 'directory_id', 'doc_name', name='unique_user_doc_name'),
+        # Listing pages, newest first
+        Index("ix_documents_user_updated", "user_id", "updated_at", "doc_id"),
+        Index("ix_documents_user_starred", "user_id", "updated_at", "doc_id",
+              postgresql_where=text("is_stared")),
+        Index("ix_documents_directory_updated", "directory_id", "updated_at", "doc_id"),
     )
     
     def __repr__(self):
         return f"<Document(id={self.doc_id}, name='{self.doc_name}', directory_id='{self.directory_id}')>"
+
+
+class DocumentRevision(Base):
+    __tablename__ = "document_revisions"
+
+    revision_id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    doc_id = Column(String(36), ForeignKey("documents.doc_id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    content = Column(Text, nullable=True)  # Full content, snapshots only
+    delta = Column(Text, nullable=True)  # JSON ops from the previous revision, deltas only
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("doc_id", "revision", name="unique_doc_revision"),
+    )
+
+    def __repr__(self):
+        return f"<DocumentRevision(doc_id={self.doc_id}, revision={self.revision}, snapshot={self.is_snapshot})>"
     
     
     
@@ -85,12 +115,15 @@ class AccessDocument(Base):
     doc_id = Column(String(36), ForeignKey("documents.doc_id",ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.user_id",ondelete="CASCADE"), nullable=False)
     permission = Column(String(20), nullable=False, default="view")
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     __table_args__ = (
         CheckConstraint("permission IN ('view', 'edit', 'owner')", name='valid_permission_type'),
-        UniqueConstraint('doc_id', 'user_id', name='unique_doc_user_access')
+        UniqueConstraint('doc_id', 'user_id', name='unique_doc_user_access'),
+        # Documents shared with a user; the unique constraint only leads with doc_id
+        Index("ix_access_documents_user_doc", "user_id", "doc_id"),
+        Index("ix_access_documents_updated", "updated_at", "access_doc_id"),
     )
     
     
@@ -0,0 +1,158 @@
+from typing import Dict, List, Any
+from decouple import config
+
+# Transforming costs one step per pair of ops, so batches are capped
+MAX_OPS_PER_MESSAGE = int(config("COLLAB_MAX_OPS_PER_MESSAGE", default="200"))
+
+
+class InvalidOperation(ValueError):
+    pass
+
+
+def normalize_operations(raw_ops: Any, max_ops: int = MAX_OPS_PER_MESSAGE) -> List[Dict]:
+    """Validate client supplied ops and return them in canonical form.
+
+    Supported ops:
+        {"type": "insert", "position": int, "text": str}
+        {"type": "delete", "position": int, "length": int}
+
+    Batches of more than `max_ops` ops are rejected.
+    """
+    if not isinstance(raw_ops, list):
+        raise InvalidOperation("ops must be a list")
+    if len(raw_ops) > max_ops:
+        raise InvalidOperation(f"at most {max_ops} ops per message")
+
+    ops = []
+    for raw in raw_ops:
+        if not isinstance(raw, dict):
+            raise InvalidOperation("op must be an object")
+
+        op_type = raw.get("type")
+        position = raw.get("position")
+        if not isinstance(position, int) or isinstance(position, bool) or position < 0:
+            raise InvalidOperation("op position must be a non-negative integer")
+
+        if op_type == "insert":
+            text = raw.get("text")
+            if not isinstance(text, str):
+                raise InvalidOperation("insert op requires text")
+            if text:
+                ops.append({"type": "insert", "position": position, "text": text})
+        elif op_type == "delete":
+            length = raw.get("length")
+            if not isinstance(length, int) or isinstance(length, bool) or length < 0:
+                raise InvalidOperation("delete op requires a non-negative length")
+            if length:
+                ops.append({"type": "delete", "position": position, "length": length})
+        else:
+            raise InvalidOperation(f"Unknown op type: {op_type}")
+
+    return ops
+
+
+def apply_operations(content: str, ops: List[Dict]) -> str:
+    """Apply ops in order; each op's position refers to the text produced by the previous op."""
+    for op in ops:
+        position = op["position"]
+        if position > len(content):
+            raise InvalidOperation("op position out of range")
+
+        if op["type"] == "insert":
+            content = content[:position] + op["text"] + content[position:]
+        else:
+            end = position + op["length"]
+            if end > len(content):
+                raise InvalidOperation("delete range out of range")
+            content = content[:position] + content[end:]
+
+    return content
+
+
+def _transform_op(op: Dict, other: Dict, op_first: bool) -> List[Dict]:
+    """Rewrite `op` so it applies on top of `other`; both were made against the same text.
+
+    `op_first` breaks ties between two inserts at the same position.
+    """
+    position = op["position"]
+
+    if other["type"] == "insert":
+        other_pos = other["position"]
+        shift = len(other["text"])
+
+        if op["type"] == "insert":
+            if position > other_pos or (position == other_pos and not op_first):
+                return [{**op, "position": position + shift}]
+            return [op]
+
+        end = position + op["length"]
+        if other_pos <= position:
+            return [{**op, "position": position + shift}]
+        if other_pos >= end:
+            return [op]
+        # Insert landed inside the deleted range: keep it, delete around it
+        head = other_pos - position
+        return [
+            {"type": "delete", "position": position, "length": head},
+            {"type": "delete", "position": position + shift, "length": op["length"] - head},
+        ]
+
+    other_pos = other["position"]
+    other_end = other_pos + other["length"]
+
+    if op["type"] == "insert":
+        if position <= other_pos:
+            return [op]
+        if position >= other_end:
+            return [{**op, "position": position - other["length"]}]
+        return [{**op, "position": other_pos}]
+
+    end = position + op["length"]
+    overlap = max(0, min(end, other_end) - max(position, other_pos))
+    length = op["length"] - overlap
+    if length == 0:
+        return []
+    if position >= other_end:
+        position -= other["length"]
+    elif position > other_pos:
+        position = other_pos
+    return [{"type": "delete", "position": position, "length": length}]
+
+
+def transform(left: List[Dict], right: List[Dict], left_first: bool = False):
+    """Transform two concurrent op lists made against the same text.
+
+    Returns (left', right') such that applying right then left' gives the same
+    text as applying left then right'. Cost is proportional to the product of
+    the two list lengths, never to the document size.
+    """
+    transformed = []
+    for op in left:
+        pieces, right = _transform_one(op, right, left_first)
+        transformed.extend(pieces)
+    return transformed, right
+
+
+def _transform_one(op: Dict, right: List[Dict], op_first: bool):
+    """Transform one op against an op list; returns (op', right').
+
+    Only a delete is ever split, and only by inserts, so `op` becomes a
+    list of deletes at most and each of them leaves `other` a single op:
+    the inner call never nests further.
+    """
+    pieces = [op]
+    transformed = []
+    for other in right:
+        if len(pieces) == 1:
+            piece = pieces[0]
+            pieces = _transform_op(piece, other, op_first)
+            others = _transform_op(other, piece, not op_first)
+        else:
+            others = [other]
+            split = []
+            for piece in pieces:
+                piece_ops, others = _transform_one(piece, others, op_first)
+                split.extend(piece_ops)
+            pieces = split
+        transformed.extend(others)
+    return pieces, transformed
@@ -0,0 +1,68 @@
+from typing import Any, List, Optional, Tuple
+from datetime import datetime
+from decouple import config
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = int(config("PAGE_SIZE_DEFAULT", default="100"))
+MAX_PAGE_SIZE = int(config("PAGE_SIZE_MAX", default="500"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Keyset page request shared by the list endpoints.
+
+    Rows come newest first by (updated_at, id). The cursor for the next page
+    is returned in the X-Next-Cursor header, and is absent on the last page.
+    """
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        updated_since: Optional[datetime] = None,
+    ) -> None:
+        self.limit = limit
+        self.cursor = decode_cursor(cursor) if cursor else None
+        self.updated_since = updated_since
+
+
+def encode_cursor(updated_at: datetime, key: Any) -> str:
+    raw = json.dumps([updated_at.isoformat(), key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, key = json.loads(raw)
+        return datetime.fromisoformat(updated_at), key
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from e
+
+
+def paginate(query, updated_column, key_column, page: PageParams):
+    """Apply the cursor, the updated_since filter, ordering and limit to
+    `query`. One extra row is fetched to tell whether another page follows."""
+    if page.updated_since is not None:
+        query = query.where(updated_column >= page.updated_since)
+    if page.cursor is not None:
+        query = query.where(tuple_(updated_column, key_column) < tuple_(*page.cursor))
+    return query.order_by(updated_column.desc(), key_column.desc()).limit(page.limit + 1)
+
+
+def finish_page(rows: List, response: Response, page: PageParams, key: str,
+                updated: str = "updated_at") -> List:
+    """Trim the look-ahead row and set the next-page cursor header. `key` and
+    `updated` name the row attributes of the columns given to `paginate`."""
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, updated), getattr(last, key))
+    return rows
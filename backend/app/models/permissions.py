@@ -0,0 +1,178 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+from collections import OrderedDict
+from decouple import config
+from fastapi import HTTPException, status
+from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import time
+
+from app.db import AsyncSessionLocal
+from app.models.models import AccessDocument, Document
+
+PERMISSION_CACHE_MAX_ENTRIES = int(config("PERMISSION_CACHE_MAX_ENTRIES", default="100000"))
+# Permissions removed through another worker stop applying here after at most this long
+PERMISSION_CACHE_TTL = float(config("PERMISSION_CACHE_TTL", default="30"))
+
+VIEW = "view"
+EDIT = "edit"
+OWNER = "owner"
+LEVELS = {VIEW: 1, EDIT: 2, OWNER: 3}
+
+
+def allows(permission: Optional[str], needed: str) -> bool:
+    return permission is not None and LEVELS[permission] >= LEVELS[needed]
+
+
+class PermissionService:
+    """What a user may do with a document: owner, edit, view, or None.
+
+    The document's owner has OWNER; anyone else has the permission of their
+    AccessDocument grant, if any. Answers are cached in an LRU keyed by
+    (user_id, doc_id), so repeat checks cost no query. Misses are resolved
+    in bulk, one query for any number of documents. Routes that already
+    hold the rows, such as the tree and the listings, `prime` the cache.
+
+    Only granted permissions are cached, so new grants apply at once on
+    every worker. Routes that grant, revoke or delete call `invalidate`
+    after they commit; other workers keep a removed permission until
+    PERMISSION_CACHE_TTL runs out.
+    """
+
+    def __init__(self, max_entries: int = PERMISSION_CACHE_MAX_ENTRIES, ttl: float = PERMISSION_CACHE_TTL,
+                 session_factory=AsyncSessionLocal) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.session_factory = session_factory
+        # Key: (user_id, doc_id); value: (expires_at, permission)
+        self.entries: "OrderedDict[Tuple[int, str], Tuple[float, Optional[str]]]" = OrderedDict()
+        # doc_id -> users with an entry for it, for invalidating a document
+        self.users_by_document: Dict[str, Set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, doc_id: str) -> Tuple[bool, Optional[str]]:
+        """(found, permission) from the cache alone."""
+        entry = self.entries.get((user_id, doc_id))
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(user_id, doc_id)
+            return False, None
+        self.entries.move_to_end((user_id, doc_id))
+        return True, entry[1]
+
+    def prime(self, user_id: int, doc_id: str, permission: Optional[str]):
+        self.entries[(user_id, doc_id)] = (time.monotonic() + self.ttl, permission)
+        self.entries.move_to_end((user_id, doc_id))
+        self.users_by_document.setdefault(doc_id, set()).add(user_id)
+        while len(self.entries) > self.max_entries:
+            (evicted_user, evicted_doc), _ = self.entries.popitem(last=False)
+            self._forget(evicted_user, evicted_doc)
+
+    def prime_owned(self, user_id: int, documents: Iterable[Document]):
+        """Cache OWNER for the listed documents that `user_id` owns."""
+        for document in documents:
+            if document.user_id == user_id:
+                self.prime(user_id, document.doc_id, OWNER)
+
+    async def resolve_many(self, user_id: int, doc_ids: Iterable[str],
+                           db: Optional[AsyncSession] = None) -> Dict[str, Optional[str]]:
+        """Permission of `user_id` on each of `doc_ids`; unknown documents
+        resolve to None. At most one query, for the ids not cached."""
+        resolved: Dict[str, Optional[str]] = {}
+        missing = []
+        for doc_id in set(doc_ids):
+            found, permission = self.get(user_id, doc_id)
+            if found:
+                resolved[doc_id] = permission
+            else:
+                missing.append(doc_id)
+        self.hits += len(resolved)
+        if not missing:
+            return resolved
+
+        self.misses += len(missing)
+        query = (
+            select(Document.doc_id, Document.user_id, AccessDocument.permission)
+            .outerjoin(
+                AccessDocument,
+                and_(AccessDocument.doc_id == Document.doc_id, AccessDocument.user_id == user_id),
+            )
+            .where(Document.doc_id.in_(missing))
+        )
+        if db is None:
+            async with self.session_factory() as session:
+                rows = (await session.execute(query)).all()
+        else:
+            rows = (await db.execute(query)).all()
+
+        for doc_id in missing:
+            resolved[doc_id] = None
+        for doc_id, owner_id, granted in rows:
+            resolved[doc_id] = OWNER if owner_id == user_id else granted
+        for doc_id in missing:
+            # "No access" is not cached: a grant made through another worker
+            # must take effect on the next request, not after the TTL
+            if resolved[doc_id] is not None:
+                self.prime(user_id, doc_id, resolved[doc_id])
+        return resolved
+
+    async def resolve(self, user_id: int, doc_id: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        return (await self.resolve_many(user_id, [doc_id], db))[doc_id]
+
+    async def require(self, user_id: int, doc_id: str, needed: str, db: Optional[AsyncSession] = None,
+                      owner_id: Optional[int] = None) -> str:
+        """The user's permission on the document, which must allow `needed`.
+
+        Documents the user cannot see at all are reported as not found. Pass
+        `owner_id` when the document row is already loaded, so the owner
+        needs no lookup.
+        """
+        if owner_id is not None and owner_id == user_id:
+            return OWNER
+
+        permission = await self.resolve(user_id, doc_id, db)
+        if permission is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        if not allows(permission, needed):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Requires {needed} permission on this document",
+            )
+        return permission
+
+    def invalidate(self, doc_id: str, *user_ids: int):
+        """Forget `doc_id` for `user_ids`, or for every user if none are given."""
+        for user_id in user_ids or list(self.users_by_document.get(doc_id, ())):
+            self._discard(user_id, doc_id)
+
+    def invalidate_documents(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            self.invalidate(doc_id)
+
+    def invalidate_user(self, user_id: int):
+        for key in [key for key in self.entries if key[0] == user_id]:
+            self._discard(*key)
+
+    def _discard(self, user_id: int, doc_id: str):
+        if self.entries.pop((user_id, doc_id), None) is not None:
+            self._forget(user_id, doc_id)
+
+    def _forget(self, user_id: int, doc_id: str):
+        users = self.users_by_document.get(doc_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.users_by_document[doc_id]
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+        }
+
+
+permissions = PermissionService()
@@ -0,0 +1,183 @@
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import json
+import logging
+
+from app.models.models import DocumentRevision
+from app.models.operations import apply_operations
+
+logger = logging.getLogger(__name__)
+
+# Every Nth revision stores the full content; the ones between store deltas
+SNAPSHOT_INTERVAL = int(config("REVISION_SNAPSHOT_INTERVAL", default="20"))
+
+INSERT_REVISIONS = insert(DocumentRevision.__table__)
+
+# SQLSTATEs of the constraint violations a revision insert can hit
+UNIQUE_VIOLATION = "23505"
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search over slice comparisons keeps the scanning in C
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def compute_delta(old: str, new: str) -> List[Dict]:
+    """Ops turning `old` into `new`: one delete and/or one insert around the
+    changed region, found by trimming the common prefix and suffix."""
+    prefix = _common_prefix_length(old, new)
+    suffix = _common_prefix_length(old[prefix:][::-1], new[prefix:][::-1])
+
+    ops = []
+    removed = len(old) - prefix - suffix
+    if removed:
+        ops.append({"type": "delete", "position": prefix, "length": removed})
+    inserted = new[prefix:len(new) - suffix]
+    if inserted:
+        ops.append({"type": "insert", "position": prefix, "text": inserted})
+    return ops
+
+
+async def latest_revision(db: AsyncSession, doc_id: str) -> int:
+    return (await latest_revisions(db, [doc_id])).get(doc_id, 0)
+
+
+async def latest_revisions(db: AsyncSession, doc_ids: List[str]) -> Dict[str, int]:
+    """Latest revision number of each document that has any, in one query."""
+    result = await db.execute(
+        select(DocumentRevision.doc_id, func.max(DocumentRevision.revision))
+        .where(DocumentRevision.doc_id.in_(doc_ids))
+        .group_by(DocumentRevision.doc_id)
+    )
+    return dict(result.all())
+
+
+async def reconstruct(db: AsyncSession, doc_id: str, revision: int) -> Optional[Tuple[str, DocumentRevision]]:
+    """Content of `revision`, rebuilt from the nearest snapshot at or before it.
+
+    Reads at most SNAPSHOT_INTERVAL rows however long the history is.
+    """
+    snapshot_result = await db.execute(
+        select(func.max(DocumentRevision.revision)).where(
+            DocumentRevision.doc_id == doc_id,
+            DocumentRevision.is_snapshot == True,
+            DocumentRevision.revision <= revision,
+        )
+    )
+    snapshot_revision = snapshot_result.scalar()
+    if snapshot_revision is None:
+        return None
+
+    result = await db.execute(
+        select(DocumentRevision)
+        .where(
+            DocumentRevision.doc_id == doc_id,
+            DocumentRevision.revision >= snapshot_revision,
+            DocumentRevision.revision <= revision,
+        )
+        .order_by(DocumentRevision.revision)
+    )
+    rows = result.scalars().all()
+    if not rows or rows[-1].revision != revision:
+        return None
+
+    content = rows[0].content or ""
+    for row in rows[1:]:
+        content = apply_operations(content, json.loads(row.delta))
+    return content, rows[-1]
+
+
+async def record_revision(db: AsyncSession, doc_id: str, content: str) -> Optional[int]:
+    """Append a revision for `doc_id` in the caller's transaction.
+
+    Identical content is not recorded. Returns the new revision number, or
+    None when nothing was written.
+    """
+    return (await record_revisions(db, {doc_id: content})).get(doc_id)
+
+
+async def record_revisions(db: AsyncSession, contents: Dict[str, str],
+                           recorded: Optional[Dict[str, Tuple[int, str]]] = None) -> Dict[str, int]:
+    """Append a revision for each document in `contents` in the caller's
+    transaction; returns doc_id -> new revision for those written.
+
+    One query finds the latest revisions and one INSERT writes the batch.
+    `recorded` maps doc_id to the (revision, content) this worker last
+    wrote; while that is still the latest revision, the delta is computed
+    from it without reading the history. Identical content is not recorded.
+    """
+    recorded = recorded or {}
+    latest = await latest_revisions(db, list(contents))
+
+    rows = []
+    for doc_id, content in contents.items():
+        content = content or ""
+        previous = latest.get(doc_id, 0)
+        revision = previous + 1
+        is_snapshot = previous == 0 or revision % SNAPSHOT_INTERVAL == 0
+
+        base = None
+        if previous:
+            known = recorded.get(doc_id)
+            if known is not None and known[0] == previous:
+                base = known[1]
+            else:
+                reconstructed = await reconstruct(db, doc_id, previous)
+                base = reconstructed[0] if reconstructed is not None else None
+            if base is None:
+                is_snapshot = True
+            elif base == content:
+                continue
+
+        rows.append({
+            "doc_id": doc_id,
+            "revision": revision,
+            "is_snapshot": is_snapshot,
+            "content": content if is_snapshot else None,
+            "delta": None if is_snapshot else json.dumps(compute_delta(base, content), separators=(",", ":")),
+        })
+    if not rows:
+        return {}
+
+    try:
+        async with db.begin_nested():
+            await db.execute(INSERT_REVISIONS, rows)
+        return {row["doc_id"]: row["revision"] for row in rows}
+    except IntegrityError:
+        pass
+
+    # Some row hit a constraint: write them one at a time so the rest land
+    written = {}
+    for row in rows:
+        try:
+            async with db.begin_nested():
+                await db.execute(INSERT_REVISIONS, [row])
+        except IntegrityError as e:
+            _log_rejected(row, e)
+        else:
+            written[row["doc_id"]] = row["revision"]
+    return written
+
+
+def _log_rejected(row: Dict, error: IntegrityError):
+    code = getattr(error.orig, "sqlstate", None)
+    message = str(error.orig).lower()
+    if code == UNIQUE_VIOLATION or (code is None and "unique" in message):
+        # Another writer took this revision number; its content wins this round
+        logger.warning(f"Revision {row['revision']} of document {row['doc_id']} already recorded")
+    elif code == FOREIGN_KEY_VIOLATION or (code is None and "foreign key" in message):
+        logger.info(f"Document {row['doc_id']} was deleted before revision {row['revision']} was recorded")
+    else:
+        logger.error(f"Revision {row['revision']} of document {row['doc_id']} rejected: {error.orig}")
@@ -0,0 +1,257 @@
+from typing import Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decouple import config
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import hashlib
+import itertools
+import logging
+import time
+
+from app.models.backplane import CHANNEL, Backplane, backplane_is_shared, create_backplane
+from app.models.models import AccessDocument, Document
+
+logger = logging.getLogger(__name__)
+
+TREE_CACHE_TTL = float(config("TREE_CACHE_TTL", default="30"))
+TREE_CACHE_MAX_USERS = int(config("TREE_CACHE_MAX_USERS", default="1024"))
+# Worker processes serving the app; gunicorn reads the same variable
+WEB_CONCURRENCY = int(config("WEB_CONCURRENCY", default="1"))
+
+CachedTree = Tuple[str, bytes]  # (etag, JSON body)
+
+
+def tree_view(root_id: Optional[str], depth: Optional[int]) -> str:
+    return f"{root_id or ''}:{'' if depth is None else depth}"
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class TreeCache(ABC):
+    """Rendered file trees per user, one entry per (root_id, depth) view.
+
+    Routes that change what a user's tree shows call `invalidate` after they
+    commit. `lookup` hands out a generation token with every miss, and
+    `store` drops trees built from a generation that has since been
+    invalidated, so a rebuild racing a write does not cache the old tree.
+    """
+
+    def __init__(self, ttl: float = TREE_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    async def lookup(self, user_id: int, view: str) -> Tuple[int, Optional[CachedTree]]:
+        """(generation, cached tree or None) for one view of a user's tree."""
+
+    @abstractmethod
+    async def store(self, user_id: int, view: str, generation: int, etag: str, body: bytes):
+        """Cache a tree built after `lookup` returned `generation`."""
+
+    @abstractmethod
+    async def invalidate(self, *user_ids: int):
+        """Drop every cached view of these users' trees."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+class NullTreeCache(TreeCache):
+    """Caches nothing; every request rebuilds the tree. ETags still spare
+    clients the body when it has not changed."""
+
+    async def lookup(self, user_id: int, view: str) -> Tuple[int, Optional[CachedTree]]:
+        self.misses += 1
+        return 0, None
+
+    async def store(self, user_id: int, view: str, generation: int, etag: str, body: bytes):
+        pass
+
+    async def invalidate(self, *user_ids: int):
+        pass
+
+
+class MemoryTreeCache(TreeCache):
+    """Per-process LRU over users.
+
+    With a `backplane`, invalidations are published to the other workers,
+    which drop the same users' trees. Without one, other workers lag by up
+    to the TTL, so create_tree_cache only picks this cache without a
+    backplane when a single worker runs.
+    """
+
+    def __init__(self, max_users: int = TREE_CACHE_MAX_USERS, ttl: float = TREE_CACHE_TTL,
+                 backplane: Optional[Backplane] = None) -> None:
+        super().__init__(ttl)
+        self.max_users = max_users
+        # Key: user_id; value: (generation, {view: (expires_at, etag, body)})
+        self.entries: "OrderedDict[int, Tuple[int, Dict[str, Tuple[float, str, bytes]]]]" = OrderedDict()
+        self.generations = itertools.count(1)
+        self.backplane = backplane
+        self.backplane_started = False
+
+    async def _start_backplane(self):
+        # Before the first lookup, so nothing is cached without listening
+        if self.backplane is not None and not self.backplane_started:
+            self.backplane_started = True
+            await self.backplane.start(self._handle_remote)
+
+    async def _handle_remote(self, _, message: Dict):
+        if message.get("type") == "invalidate":
+            self._invalidate(message.get("user_ids", []))
+
+    async def lookup(self, user_id: int, view: str) -> Tuple[int, Optional[CachedTree]]:
+        await self._start_backplane()
+        entry = self.entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return 0, None
+
+        self.entries.move_to_end(user_id)
+        generation, views = entry
+        cached = views.get(view)
+        if cached is None or cached[0] < time.monotonic():
+            views.pop(view, None)
+            self.misses += 1
+            return generation, None
+
+        self.hits += 1
+        return generation, cached[1:]
+
+    async def store(self, user_id: int, view: str, generation: int, etag: str, body: bytes):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            if generation:
+                return  # Evicted or invalidated since the lookup
+            entry = self.entries[user_id] = (0, {})
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+        elif entry[0] != generation:
+            return
+
+        entry[1][view] = (time.monotonic() + self.ttl, etag, body)
+
+    async def invalidate(self, *user_ids: int):
+        self._invalidate(user_ids)
+        if self.backplane is not None and user_ids:
+            await self._start_backplane()
+            try:
+                await self.backplane.publish("", {"type": "invalidate", "user_ids": list(user_ids)})
+            except Exception as e:
+                logger.error(f"Error publishing tree invalidation: {e}")
+
+    def _invalidate(self, user_ids):
+        for user_id in user_ids:
+            # A fresh generation, even for users with nothing cached, so that
+            # builds already in flight are not stored
+            self.entries[user_id] = (next(self.generations), {})
+            self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+
+    async def close(self):
+        if self.backplane_started:
+            self.backplane_started = False
+            await self.backplane.stop()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "users": len(self.entries), "max_users": self.max_users}
+
+
+class RedisTreeCache(TreeCache):
+    """Shared across workers. Each user has a generation counter, and trees
+    live in a hash named after the current generation, so invalidating is a
+    single INCR and superseded hashes simply expire."""
+
+    def __init__(self, url: str, ttl: float = TREE_CACHE_TTL, prefix: str = "smartnotes:tree") -> None:
+        super().__init__(ttl)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("TREE_CACHE_BACKEND=redis requires the 'redis' package") from e
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def lookup(self, user_id: int, view: str) -> Tuple[int, Optional[CachedTree]]:
+        generation = int(await self.client.get(f"{self.prefix}:{user_id}:generation") or 0)
+        cached = await self.client.hmget(f"{self.prefix}:{user_id}:{generation}", f"{view}:etag", f"{view}:body")
+        if cached[0] is None or cached[1] is None:
+            self.misses += 1
+            return generation, None
+
+        self.hits += 1
+        return generation, (cached[0].decode(), cached[1])
+
+    async def store(self, user_id: int, view: str, generation: int, etag: str, body: bytes):
+        key = f"{self.prefix}:{user_id}:{generation}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={f"{view}:etag": etag, f"{view}:body": body})
+            pipe.expire(key, max(1, int(self.ttl)))
+            await pipe.execute()
+
+    async def invalidate(self, *user_ids: int):
+        if not user_ids:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.incr(f"{self.prefix}:{user_id}:generation")
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def document_grantees(db: AsyncSession, *criteria) -> List[int]:
+    """Users holding access grants on the documents matching `criteria`;
+    their trees list those documents under shared_documents."""
+    result = await db.execute(
+        select(AccessDocument.user_id)
+        .join(Document, AccessDocument.doc_id == Document.doc_id)
+        .where(*criteria)
+        .distinct()
+    )
+    return list(result.scalars().all())
+
+
+def create_tree_cache() -> TreeCache:
+    # "auto": in memory when invalidations reach every worker, that is with
+    # a single worker or a shared COLLAB_BACKPLANE; otherwise no caching
+    kind = config("TREE_CACHE_BACKEND", default="auto")
+
+    if kind == "redis":
+        return RedisTreeCache(config("REDIS_URL", default="redis://localhost:6379/0"))
+
+    if kind == "none":
+        return NullTreeCache()
+
+    backplane = create_backplane(f"{CHANNEL}_tree") if backplane_is_shared() else None
+    if kind == "memory" or backplane is not None or WEB_CONCURRENCY <= 1:
+        return MemoryTreeCache(backplane=backplane)
+
+    logger.warning(
+        f"Tree cache disabled: {WEB_CONCURRENCY} workers (WEB_CONCURRENCY) cannot share invalidations "
+        "over COLLAB_BACKPLANE=memory. Set COLLAB_BACKPLANE=postgres or redis, or TREE_CACHE_BACKEND=redis, "
+        "to enable it."
+    )
+    return NullTreeCache()
+
+
+tree_cache = create_tree_cache()
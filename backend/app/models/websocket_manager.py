@@ -1,65 +1,137 @@
 from fastapi import WebSocket
-from typing import Dict, List, Optional, Any
-from collections import defaultdict
+from typing import Dict, List, Optional, Any, Set, Tuple
+from collections import deque
+from itertools import islice
+from decouple import config
+import asyncio
+import hashlib
 import logging
 import time
-import json
+from app.models.backplane import Backplane, create_backplane
+from app.models.collab_session import Connection, Cursor, DocumentSession
+from app.models.document_cache import DocumentCache, document_cache
+from app.models.document_flusher import DocumentFlusher
+from app.models.operations import InvalidOperation, apply_operations, normalize_operations, transform
+from app.models.wire import JSON_CODEC, Frame
 
 logger = logging.getLogger(__name__)
 
+HISTORY_SIZE = int(config("COLLAB_HISTORY_SIZE", default="500"))
+CURSOR_FLUSH_HZ = float(config("COLLAB_CURSOR_HZ", default="20"))
+PING_INTERVAL = float(config("COLLAB_PING_INTERVAL", default="20"))
+IDLE_TIMEOUT = float(config("COLLAB_IDLE_TIMEOUT", default="60"))
+CURSOR_TTL = float(config("COLLAB_CURSOR_TTL", default="30"))
+SEND_QUEUE_SIZE = int(config("COLLAB_SEND_QUEUE_SIZE", default="256"))
+# Op pairs a late batch may be transformed through before the client is
+# resynced instead; bounds the time one message can hold the event loop
+MAX_TRANSFORM_PAIRS = int(config("COLLAB_MAX_TRANSFORM_PAIRS", default="200000"))
+# "drop": discard the backlog of a client that falls behind and send it a resync snapshot
+# "close": disconnect it so it reconnects and starts from a fresh init
+SLOW_CLIENT_POLICY = config("COLLAB_SLOW_CLIENT_POLICY", default="drop")
+
+
+def content_digest(content: str) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
 
 class DocumentManager:
-    def __init__(self) -> None:
-        self.active_connections: Dict[str, List[WebSocket]] = defaultdict(list) # Key: docid, Value: websocket
-        self.connection_info: Dict[str, Dict[str, Any]] = {}  # Key: WebSocket, Value: connection info
-        self.document_content: Dict[str, str] = {}
-        self.user_cursors: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+    """Live collaboration sessions of this worker.
+
+    Each document has one sequencer among the workers with clients on it:
+    the worker holding its backplane claim. Only the sequencer assigns
+    revisions, transforms ops and writes the content. The other workers
+    follow it. They forward their clients' edits as "submit" messages and
+    apply its committed "ops" and "update" messages in revision order.
+
+    A follower that joins late, misses a revision or cannot apply one does
+    not relay anything it cannot place. It asks for a "sync" instead: the
+    sequencer flushes the content and announces its revision and digest,
+    the follower reads it back from the database and resyncs its clients.
+    When the sequencer's last client leaves it releases the claim and a
+    follower takes over; the reaper also takes over claims whose worker
+    went away.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None,
+                 flusher: Optional[DocumentFlusher] = None,
+                 cache: Optional[DocumentCache] = None) -> None:
+        self.sessions: Dict[str, DocumentSession] = {}  # Key: docid
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.moved_sessions: Set[DocumentSession] = set()  # Sessions with cursor moves since the last tick
+        self.cursor_event = asyncio.Event()
+        self.cursor_task: Optional[asyncio.Task] = None
+        self.reaper_task: Optional[asyncio.Task] = None
+        self.slow_client_events = 0
         self.COLORS = [
             "#3b82f6", "#ef4444", "#10b981", "#f59e0b",
             "#8b5cf6", "#06b6d4", "#f97316", "#84cc16",
             "#ec4899", "#6366f1", "#14b8a6", "#f43f5e"
         ]
+        self.backplane = backplane or create_backplane()
+        self.backplane_started = False
+        self.flusher = flusher or DocumentFlusher()
+        self.document_cache = cache or document_cache
+
+    async def start(self):
+        if not self.backplane_started:
+            self.backplane_started = True
+            await self.backplane.start(self.handle_remote_message)
+            await self.flusher.start()
+            self.document_cache.add_writer(self.flusher)
+            self.cursor_task = asyncio.create_task(self._cursor_loop())
+            self.reaper_task = asyncio.create_task(self._reaper_loop())
+
+    async def shutdown(self):
+        if self.backplane_started:
+            self.backplane_started = False
+            await self.backplane.stop()
+            await self.flusher.stop()
+            self.document_cache.remove_writer(self.flusher)
+            for task in (self.cursor_task, self.reaper_task):
+                if task:
+                    task.cancel()
+            self.cursor_task = self.reaper_task = None
 
     async def connect(self, doc_id: str, websocket: WebSocket, user_id: Optional[str] = None,
-                      user_name: Optional[str] = None):
-        await websocket.accept()
+                      user_name: Optional[str] = None, codec=JSON_CODEC,
+                      subprotocol: Optional[str] = None, can_edit: bool = True):
+        await self.start()
+        await websocket.accept(subprotocol=subprotocol)
         
         user_id = user_id or f"anonymous_{int(time.time())}"
         user_name = user_name or "Anonymous"
-        
-        self.connection_info[websocket] = {
-            "doc_id": doc_id,
-            "user_id": user_id,
-            "user_name": user_name,
-            "connected_at": time.time()
-        }
-        self.active_connections[doc_id].append(websocket)
-
-        # Send initial document state
-        if doc_id in self.document_content:
-            await self._send_message(websocket, {
-                "type": "init",
-                "content": self.document_content[doc_id],
-                "active_users": len(self.active_connections[doc_id])
-            })
+        color = self.COLORS[sum(ord(c) for c in str(user_id)) % len(self.COLORS)]
+
+        session = self.sessions.get(doc_id)
+        opened = session is None
+        if opened:
+            session = self.sessions[doc_id] = DocumentSession(doc_id, HISTORY_SIZE)
+        conn = Connection(websocket, session, user_id, user_name, color, codec, can_edit)
+        self.connections[websocket] = conn
+        session.connections.add(conn)
+        self.open_writer(conn)
+
+        # First joiner on this worker claims the document or follows its
+        # sequencer; whoever is connected gets the init once the state is in
+        if opened:
+            await self._open_session(session)
+        elif session.content is not None:
+            await self.send_message(websocket, self._init_message(session))
 
         #NOTE: Send existing cursors
-        for cursor_user_id, cursor_data in self.user_cursors.get(doc_id, {}).items():
-            if cursor_user_id != user_id:  # Don't send back their own cursor
-                await self._send_message(websocket, {
-                    "type": "cursor_update",
-                    "user_id": cursor_user_id,
-                    "user_name": cursor_data.get("user_name"),
-                    "position": cursor_data.get("position"),
-                    "color": cursor_data.get("color")
-                })
+        cursors = [
+            cursor.to_message() for cursor_user_id, cursor in session.cursors.items()
+            if cursor_user_id != user_id  # Don't send back their own cursor
+        ]
+        if cursors:
+            await self.send_message(websocket, {"type": "cursors", "cursors": cursors})
 
         # Notify others about new user
         await self.broadcast(doc_id, {
             "type": "user_joined",
             "user_id": user_id,
             "user_name": user_name,
-            "active_users": len(self.active_connections[doc_id])
+            "active_users": len(session.connections)
         }, exclude=websocket)
 
         logger.info(f"User {user_id} ({user_name}) connected to document {doc_id}")
@@ -68,19 +140,19 @@ class DocumentManager:
 
 
     async def disconnect(self, websocket: WebSocket):
-        if websocket not in self.connection_info:
+        conn = self.connections.pop(websocket, None)
+        if conn is None:
             return
 
-        conn_info = self.connection_info[websocket]
-        doc_id = conn_info["doc_id"]
-        user_id = conn_info["user_id"]
+        session = conn.session
+        doc_id = session.doc_id
+        user_id = conn.user_id
 
         try:
-            if websocket in self.active_connections[doc_id]:
-                self.active_connections[doc_id].remove(websocket)
+            session.connections.discard(conn)
 
-            if doc_id in self.user_cursors and user_id in self.user_cursors[doc_id]:
-                del self.user_cursors[doc_id][user_id]
+            session.moved_cursors.discard(user_id)
+            if session.cursors.pop(user_id, None) is not None:
                 await self.broadcast(doc_id, {
                     "type": "cursor_removed",
                     "user_id": user_id
@@ -89,89 +161,706 @@ class DocumentManager:
             await self.broadcast(doc_id, {
                 "type": "user_left",
                 "user_id": user_id,
-                "active_users": len(self.active_connections[doc_id])
+                "active_users": len(session.connections)
             })
 
             # Cleanup if no more connections
-            if not self.active_connections[doc_id]:
-                self.document_content.pop(doc_id, None)
-                self.user_cursors.pop(doc_id, None)
+            if not session.connections and self.sessions.get(doc_id) is session:
+                del self.sessions[doc_id]
+                self.moved_sessions.discard(session)
+                written = await self.flusher.flush([doc_id])
+                # Unedited content is still cached as loaded; unsaved content is not cached
+                if doc_id in written and session.content is not None:
+                    self.document_cache.put(doc_id, session.content, written[doc_id])
+                # Followers take over from the flushed content
+                if session.sequencer and doc_id not in self.sessions:
+                    await self._release(doc_id)
+                    await self._publish(doc_id, {"type": "released", "revision": session.revision})
 
         finally:
-            self.connection_info.pop(websocket, None)
+            self.close_writer(conn)
             logger.info(f"User {user_id} disconnected from document {doc_id}")
             
             
 
     async def handle_message(self, websocket: WebSocket, message: Dict):
-        if websocket not in self.connection_info:
+        conn = self.connections.get(websocket)
+        if conn is None:
             return
 
-        conn_info = self.connection_info[websocket]
-        doc_id = conn_info["doc_id"]
-        user_id = conn_info["user_id"]
-        user_name = conn_info["user_name"]
+        conn.last_seen = time.time()
+        session = conn.session
         msg_type = message.get("type")
 
-        if msg_type == "update":
-            content = message.get("content", "")
-            self.document_content[doc_id] = content
-            await self.broadcast(doc_id, {
-                "type": "update",
-                "content": content,
-                "user_id": user_id,
-                "user_name": user_name,
-                "timestamp": message.get("timestamp")
-            }, exclude=websocket)
+        if msg_type == "ping":
+            await self.send_message(websocket, {"type": "pong"})
+
+        elif msg_type in ("update", "ops") and not conn.can_edit:
+            await self.send_message(websocket, {
+                "type": "error",
+                "message": "This document is shared with you as view only"
+            })
+
+        elif msg_type == "update" and not session.sequencer:
+            await self._submit(conn, {"kind": "update", "content": message.get("content", "")}, message)
+
+        elif msg_type == "update":
+            committed = self._commit_update(session, message.get("content", ""), self._author(conn, message))
+            await self.broadcast(session.doc_id, committed, exclude=websocket)
+
+        elif msg_type == "ops":
+            await self.apply_ops(conn, message)
 
         elif msg_type == "cursor":
             position = message.get("position", {})
-            await self.update_cursor(doc_id, user_id, position, user_name)
+            self.update_cursor(conn, position)
             
             
 
-    async def update_cursor(self, doc_id: str, user_id: str, position: Dict, user_name: str):
-        color = self.COLORS[sum(ord(c) for c in str(user_id)) % len(self.COLORS)]
-        
-        self.user_cursors[doc_id][user_id] = {
-            "position": position,
-            "user_name": user_name,
-            "color": color,
-            "timestamp": time.time()
+    async def apply_ops(self, conn: Connection, message: Dict):
+        """Apply client ops made against `message["revision"]`.
+
+        Ops are transformed against everything committed since that revision,
+        so concurrent editors converge without resending snapshots. Clients
+        keep at most one batch in flight and wait for its "ack".
+        """
+        session = conn.session
+        websocket = conn.websocket
+        if session.content is None:
+            await self.send_message(websocket, {
+                "type": "error",
+                "message": "Document state not initialized, send a full update first"
+            })
+            return
+
+        base_revision = message.get("revision", session.revision)
+        try:
+            if session.sequencer:
+                rebased = self._rebase(session, base_revision, message.get("ops"))
+            else:
+                # Checked here so malformed batches never reach the sequencer
+                await self._submit(conn, {
+                    "kind": "ops",
+                    "revision": base_revision,
+                    "ops": normalize_operations(message.get("ops")),
+                }, message)
+                return
+        except InvalidOperation as e:
+            await self.send_message(websocket, {
+                "type": "error",
+                "message": f"Invalid ops: {e}"
+            })
+            await self.send_resync(conn)
+            return
+
+        if rebased is None:
+            await self.send_resync(conn)
+            return
+
+        committed = self._commit_ops(session, *rebased, self._author(conn, message))
+        await self.send_message(websocket, {
+            "type": "ack",
+            "revision": session.revision,
+            "seq": message.get("seq")
+        })
+
+        # Peers only get the delta, never the full content
+        await self.broadcast(session.doc_id, committed, exclude=websocket)
+
+
+
+    def _rebase(self, session: DocumentSession, base_revision: Any,
+                raw_ops: Any) -> Optional[Tuple[List[Dict], str]]:
+        """Ops made against `base_revision`, transformed against everything
+        committed since, and the content they produce. None when the sender
+        must resync instead. Raises InvalidOperation."""
+        history = session.history
+        if (not isinstance(base_revision, int) or base_revision > session.revision
+                or session.revision - base_revision > len(history)):
+            return None
+
+        ops = normalize_operations(raw_ops)
+        missed = session.revision - base_revision
+        concurrent = [committed_ops for _, committed_ops in islice(history, len(history) - missed, None)]
+        if len(ops) * sum(len(committed_ops) for committed_ops in concurrent) > MAX_TRANSFORM_PAIRS:
+            return None
+        for committed_ops in concurrent:
+            ops, _ = transform(ops, committed_ops)
+        return ops, apply_operations(session.content, ops)
+
+
+
+    def _author(self, conn: Connection, message: Dict) -> Dict:
+        return {"user_id": conn.user_id, "user_name": conn.user_name, "timestamp": message.get("timestamp")}
+
+
+
+    def _commit_ops(self, session: DocumentSession, ops: List[Dict], content: str, author: Dict) -> Dict:
+        """Commit rebased ops as the next revision; returns the "ops" message for peers."""
+        session.content = content
+        session.revision += 1
+        session.history.append((session.revision, ops))
+        self.flusher.mark_dirty(session.doc_id, content)
+        return {"type": "ops", "ops": ops, "revision": session.revision, **author}
+
+
+
+    def _commit_update(self, session: DocumentSession, content: str, author: Dict) -> Dict:
+        session.replace_content(content, session.revision + 1)
+        self.flusher.mark_dirty(session.doc_id, content)
+        return {"type": "update", "content": content, "revision": session.revision, **author}
+
+
+
+    def _init_message(self, session: DocumentSession) -> Dict:
+        return {
+            "type": "init",
+            "content": session.content,
+            "revision": session.revision,
+            "active_users": len(session.connections)
         }
 
-        await self.broadcast(doc_id, {
-            "type": "cursor_update",
-            "user_id": user_id,
-            "user_name": user_name,
-            "position": position,
-            "color": color
-        }, exclude=None)
-        
-        
 
-    async def broadcast(self, doc_id: str, message: Dict, exclude: Optional[WebSocket] = None):
-        if doc_id not in self.active_connections:
+
+    def _resync_message(self, session: DocumentSession) -> Dict:
+        return {
+            "type": "resync",
+            "content": session.content or "",
+            "revision": session.revision
+        }
+
+
+
+    async def send_resync(self, conn: Connection):
+        await self.send_message(conn.websocket, self._resync_message(conn.session))
+
+
+
+    async def send_state(self, session: DocumentSession, msg_type: str):
+        """Send every local client the current state as an "init" or a "resync"."""
+        for conn in list(session.connections):
+            if msg_type == "init":
+                await self.send_message(conn.websocket, self._init_message(session))
+            else:
+                await self.send_resync(conn)
+
+
+
+    async def _open_session(self, session: DocumentSession):
+        doc_id = session.doc_id
+        session.sequencer = await self._claim(session)
+        if not session.sequencer:
+            await self._request_sync(session)
             return
 
-        for ws in list(self.active_connections[doc_id]):  
-            if ws != exclude:
+        # Seed the live state from the last session's unsaved edits, whose
+        # flush may still be running, else from the hot cache / database
+        content = self.flusher.unsaved(doc_id)
+        if content is None:
+            try:
+                content = await self.document_cache.load(doc_id)
+            except Exception as e:
+                logger.error(f"Error loading document {doc_id}: {e}")
+                content = None
+        if content is not None and session.content is None:
+            session.replace_content(content, 0)
+            await self.send_state(session, "init")
+
+
+
+    async def _claim(self, session: DocumentSession) -> bool:
+        doc_id = session.doc_id
+        try:
+            claimed = await self.backplane.claim(doc_id)
+        except Exception as e:
+            logger.error(f"Error claiming document {doc_id}: {e}")
+            return False
+        if claimed and doc_id not in self.sessions:
+            # Everyone left while the claim was being taken
+            await self._release(doc_id)
+            return False
+        return claimed
+
+
+
+    async def _release(self, doc_id: str):
+        try:
+            await self.backplane.release(doc_id)
+        except Exception as e:
+            logger.error(f"Error releasing document {doc_id}: {e}")
+
+
+
+    async def _promote(self, session: DocumentSession, revision: Optional[int] = None):
+        """Sequence a document this worker has been following.
+
+        The replica is kept when it is in step (with `revision`, if the old
+        sequencer announced one), otherwise the stored content is loaded.
+        Edits in flight to the old sequencer are lost, so every local client
+        is resynced.
+        """
+        doc_id = session.doc_id
+        msg_type = "init" if session.content is None else "resync"
+        session.sequencer = True
+        if session.content is not None and session.sync_buffer is None and revision in (None, session.revision):
+            # The old sequencer may not have flushed it
+            self.flusher.mark_dirty(doc_id, session.content)
+        else:
+            try:
+                content = await self.document_cache.load(doc_id)
+            except Exception as e:
+                logger.error(f"Error loading document {doc_id}: {e}")
+                content = None
+            if content is None:
+                return
+            session.replace_content(content, session.revision if revision is None else revision)
+        session.sync_buffer = None
+        logger.info(f"Sequencing document {doc_id} from revision {session.revision}")
+        await self.send_state(session, msg_type)
+
+
+
+    async def _submit(self, conn: Connection, edit: Dict, message: Dict):
+        """Forward a client's edit to the worker sequencing the document;
+        if that fails the client is told and resynced, as for a rejection."""
+        forwarded = await self._publish(conn.session.doc_id, {
+            "type": "submit",
+            **edit,
+            **self._author(conn, message),
+            "node": self.backplane.node_id,
+            "conn": id(conn),
+            "seq": message.get("seq"),
+        })
+        if not forwarded:
+            await self.send_message(conn.websocket, {
+                "type": "error",
+                "message": "Edit could not be sent to the document's other editors"
+            })
+            await self.send_resync(conn)
+
+
+
+    async def _apply_submit(self, session: DocumentSession, message: Dict):
+        """Sequence an edit a follower forwarded. The follower acks or
+        resyncs its client when the outcome comes back over the backplane."""
+        doc_id = session.doc_id
+        origin = {"node": message.get("node"), "conn": message.get("conn"), "seq": message.get("seq")}
+        author = {key: message.get(key) for key in ("user_id", "user_name", "timestamp")}
+
+        if message.get("kind") == "update":
+            committed = self._commit_update(session, message.get("content", ""), author)
+        else:
+            rebased, error = None, "Document state not initialized, send a full update first"
+            if session.content is not None:
                 try:
-                    await self.send_message(ws, message)
-                except:
-                    await self.cleanup_disconnected(ws)
-                    
-                    
+                    rebased, error = self._rebase(session, message.get("revision"), message.get("ops")), None
+                except InvalidOperation as e:
+                    error = f"Invalid ops: {e}"
+            if rebased is None:
+                await self._publish(doc_id, {"type": "rejected", "node": origin["node"],
+                                             "conn": origin["conn"], "message": error})
+                return
+            committed = self._commit_ops(session, *rebased, author)
 
-    async def send_message(self, websocket: WebSocket, message: Dict):
+        await self.broadcast_local(doc_id, committed)
+        await self._publish(doc_id, {**committed, "origin": origin})
+
+
+
+    def _local_connection(self, session: DocumentSession, origin: Any) -> Optional[Connection]:
+        """The connection on this worker that `origin` ({"node", "conn"}) names, if still open."""
+        if not isinstance(origin, dict) or origin.get("node") != self.backplane.node_id:
+            return None
+        return next((conn for conn in session.connections if id(conn) == origin.get("conn")), None)
+
+
+
+    async def _request_sync(self, session: DocumentSession):
+        """Ask the sequencer for the document's state. Committed messages
+        are held back until it arrives."""
+        if session.sync_buffer is None:
+            session.sync_buffer = deque(maxlen=HISTORY_SIZE)
+        await self._publish(session.doc_id, {"type": "sync_request", "node": self.backplane.node_id})
+
+
+
+    async def _answer_sync(self, session: DocumentSession, node: Any):
+        """Flush the content so a follower can read it back, then announce
+        the revision and digest of what was written."""
+        doc_id = session.doc_id
+        content, revision = session.content, session.revision
+        if content is None:
+            return
+        self.flusher.mark_dirty(doc_id, content)
+        if doc_id not in await self.flusher.flush([doc_id]):
+            return  # The follower asks again
+        await self._publish(doc_id, {
+            "type": "sync",
+            "node": node,
+            "revision": revision,
+            "digest": content_digest(content),
+        })
+
+
+
+    async def _finish_sync(self, session: DocumentSession, message: Dict):
+        doc_id = session.doc_id
+        revision = message.get("revision")
+        if session.sync_buffer is None or not isinstance(revision, int):
+            return
         try:
-            await websocket.send_json(message)
+            content = await self.document_cache.load(doc_id)
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            await self.cleanup_disconnected(websocket)
-            
-            
+            logger.error(f"Error loading document {doc_id}: {e}")
+            return
+        if self.sessions.get(doc_id) is not session or session.sync_buffer is None:
+            return
+        if content is None or content_digest(content) != message.get("digest"):
+            # Written again since the sync was announced
+            await self._request_sync(session)
+            return
+
+        msg_type = "init" if session.content is None else "resync"
+        buffered, session.sync_buffer = session.sync_buffer, None
+        session.replace_content(content, revision)
+        for committed in buffered:
+            applied = committed.get("revision")
+            if isinstance(applied, int) and applied > session.revision and not self._apply_committed(session, committed):
+                await self._request_sync(session)
+                return
+        await self.send_state(session, msg_type)
+
+
+
+    def _apply_committed(self, session: DocumentSession, message: Dict) -> bool:
+        """Apply the sequencer's next revision to our replica."""
+        revision = message.get("revision")
+        if revision != session.revision + 1 or session.content is None:
+            return False
+        if message.get("type") == "update":
+            session.replace_content(message.get("content", ""), revision)
+            return True
+        try:
+            session.content = apply_operations(session.content, message.get("ops"))
+        except InvalidOperation:
+            logger.warning(f"Revision {revision} does not apply to document {session.doc_id}")
+            return False
+        session.revision = revision
+        session.history.append((revision, message.get("ops")))
+        return True
+
+
+
+    async def _follow(self, session: DocumentSession, message: Dict):
+        """Apply a revision committed by the sequencer and relay it; acks
+        go to the local client that submitted it."""
+        if session.sync_buffer is not None:
+            session.sync_buffer.append(message)
+            return
+        revision = message.get("revision")
+        if not isinstance(revision, int) or revision <= session.revision:
+            return  # Already applied
+        if not self._apply_committed(session, message):
+            logger.warning(f"Document {session.doc_id} fell out of step at revision {revision}, syncing")
+            session.sync_buffer = deque([message], maxlen=HISTORY_SIZE)
+            await self._request_sync(session)
+            return
+
+        origin = message.pop("origin", None)
+        submitter = self._local_connection(session, origin)
+        if submitter is not None and message.get("type") == "ops":
+            await self.send_message(submitter.websocket, {
+                "type": "ack",
+                "revision": revision,
+                "seq": origin.get("seq")
+            })
+        await self.broadcast_local(session.doc_id, message,
+                                   exclude=submitter.websocket if submitter is not None else None)
+
+
+
+    async def handle_remote_message(self, doc_id: str, message: Dict):
+        """Handle a message published by another worker: sequencing traffic
+        for documents open here, or a broadcast for our own sockets."""
+        session = self.sessions.get(doc_id)
+        if session is None:
+            return
+
+        msg_type = message.get("type")
+
+        if msg_type == "submit":
+            if session.sequencer:
+                await self._apply_submit(session, message)
+
+        elif msg_type == "sync_request":
+            if session.sequencer:
+                await self._answer_sync(session, message.get("node"))
+
+        elif msg_type == "sync":
+            if message.get("node") == self.backplane.node_id:
+                await self._finish_sync(session, message)
+
+        elif msg_type == "rejected":
+            conn = self._local_connection(session, message)
+            if conn is not None:
+                if message.get("message"):
+                    await self.send_message(conn.websocket, {"type": "error", "message": message["message"]})
+                await self.send_resync(conn)
+
+        elif msg_type == "released":
+            if not session.sequencer and await self._claim(session):
+                await self._promote(session, message.get("revision"))
+
+        elif msg_type in ("ops", "update"):
+            if session.sequencer:
+                # Only the claim holder commits; never merge a second history
+                logger.warning(f"Ignoring revision {message.get('revision')} of document {doc_id} "
+                               f"committed by another worker")
+            else:
+                await self._follow(session, message)
+
+        else:
+            await self.broadcast_local(doc_id, message)
+
+
+
+    def update_cursor(self, conn: Connection, position: Dict):
+        """Record the latest position; peers get it with the next batched "cursors" frame."""
+        session = conn.session
+        cursor = session.cursors.get(conn.user_id)
+        if cursor is None:
+            cursor = session.cursors[conn.user_id] = Cursor(conn.user_id, conn.user_name, conn.color)
+        cursor.position = position
+        cursor.timestamp = time.time()
+
+        session.moved_cursors.add(conn.user_id)
+        self.moved_sessions.add(session)
+        self.cursor_event.set()
+
+
+
+    async def _cursor_loop(self):
+        interval = 1 / CURSOR_FLUSH_HZ
+        while True:
+            # Sleep until someone moves, then let a full tick of moves accumulate
+            await self.cursor_event.wait()
+            await asyncio.sleep(interval)
+            self.cursor_event.clear()
+            try:
+                await self.flush_cursors()
+            except Exception as e:
+                logger.error(f"Error flushing cursors: {e}")
+
+
+
+    async def flush_cursors(self):
+        sessions, self.moved_sessions = self.moved_sessions, set()
+
+        for session in sessions:
+            moved, session.moved_cursors = session.moved_cursors, set()
+            entries = {uid: session.cursors[uid].to_message() for uid in moved if uid in session.cursors}
+            if not entries:
+                continue
+            message = {"type": "cursors", "cursors": list(entries.values())}
+            frames: Dict[Any, Optional[Frame]] = {}
+
+            for conn in list(session.connections):
+                uid = conn.user_id
+                key = (uid if uid in entries else None, conn.codec.name)
+                if key not in frames:
+                    if key[0] is None:
+                        frames[key] = conn.codec.encode(message)
+                    else:
+                        # Movers get the batch without their own cursor
+                        others = [entry for other, entry in entries.items() if other != uid]
+                        frames[key] = conn.codec.encode({"type": "cursors", "cursors": others}) if others else None
+                if frames[key] is not None:
+                    self.send_frame(conn, frames[key])
+
+            try:
+                await self.backplane.publish(session.doc_id, message)
+            except Exception as e:
+                logger.error(f"Error publishing to backplane: {e}")
+
+
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping connections: {e}")
+
+
+
+    async def reap(self):
+        """Ping quiet connections, evict the ones that stopped answering,
+        expire cursors that have not moved for CURSOR_TTL seconds and check
+        each document's sequencer claim."""
+        now = time.time()
+
+        for conn in list(self.connections.values()):
+            idle = now - conn.last_seen
+            if idle > IDLE_TIMEOUT:
+                logger.info(f"Evicting idle connection of user {conn.user_id} on document {conn.session.doc_id}")
+                asyncio.create_task(self.evict(conn.websocket, code=1001))
+            elif idle >= PING_INTERVAL:
+                await self.send_message(conn.websocket, {"type": "ping"})
+
+        for session in list(self.sessions.values()):
+            expired = [uid for uid, cursor in session.cursors.items() if now - cursor.timestamp > CURSOR_TTL]
+            for uid in expired:
+                del session.cursors[uid]
+                session.moved_cursors.discard(uid)
+                await self.broadcast(session.doc_id, {
+                    "type": "cursor_removed",
+                    "user_id": uid
+                })
+            await self.check_claim(session)
+
+
+
+    async def check_claim(self, session: DocumentSession):
+        """Renew the claim on a document this worker sequences, or take over
+        one whose sequencer went away without releasing it."""
+        claimed = await self._claim(session)
+        if self.sessions.get(session.doc_id) is not session:
+            return
+        if session.sequencer and not claimed:
+            logger.warning(f"Lost the claim on document {session.doc_id}, following its new sequencer")
+            session.sequencer = False
+            await self._request_sync(session)
+        elif claimed and not session.sequencer:
+            await self._promote(session)
+        elif session.sync_buffer is not None:
+            await self._request_sync(session)  # The request or its answer was lost
+
+
+
+    async def broadcast(self, doc_id: str, message: Dict, exclude: Optional[WebSocket] = None):
+        await self.broadcast_local(doc_id, message, exclude)
+        await self._publish(doc_id, message)
+
+
+
+    async def _publish(self, doc_id: str, message: Dict) -> bool:
+        try:
+            await self.backplane.publish(doc_id, message)
+        except Exception as e:
+            logger.error(f"Error publishing to backplane: {e}")
+            return False
+        return True
+
+
+
+    async def broadcast_local(self, doc_id: str, message: Dict, exclude: Optional[WebSocket] = None):
+        session = self.sessions.get(doc_id)
+        if session is None:
+            return
+
+        # Encode once per wire format, enqueue the same frame for every peer
+        frames: Dict[str, Frame] = {}
+        for conn in list(session.connections):
+            if conn.websocket is exclude:
+                continue
+            frame = frames.get(conn.codec.name)
+            if frame is None:
+                frame = frames[conn.codec.name] = conn.codec.encode(message)
+            self.send_frame(conn, frame)
+
+
+
+    async def send_message(self, websocket: WebSocket, message: Dict):
+        conn = self.connections.get(websocket)
+        if conn is None or conn.queue is None:
+            codec = conn.codec if conn is not None else JSON_CODEC
+            try:
+                await self._send_frame_now(websocket, codec.encode(message))
+            except Exception as e:
+                logger.error(f"Error sending message: {e}")
+            return
+
+        self.send_frame(conn, conn.codec.encode(message))
+
+
+
+    async def _send_frame_now(self, websocket: WebSocket, frame: Frame):
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+
+
+    def send_frame(self, conn: Connection, frame: Frame):
+        """Queue an encoded frame for the connection's writer task; never waits on the network."""
+        queue = conn.queue
+        if queue is None:
+            return
+
+        if queue.full():
+            self.slow_client_events += 1
+            if SLOW_CLIENT_POLICY == "close":
+                self.close_writer(conn)
+                asyncio.create_task(self.evict(conn.websocket))
+                return
+
+            while not queue.empty():
+                queue.get_nowait()
+            if conn.session.content is not None:
+                frame = conn.codec.encode(self._resync_message(conn.session))
+
+        queue.put_nowait(frame)
+
+
+
+    def open_writer(self, conn: Connection):
+        conn.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        conn.writer = asyncio.create_task(self._write_loop(conn, conn.queue))
+
+
+
+    def close_writer(self, conn: Connection):
+        """Let the writer drain what is already queued, then stop."""
+        queue, task = conn.queue, conn.writer
+        conn.queue = conn.writer = None
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            if task is not asyncio.current_task():
+                task.cancel()
+
+
+
+    async def _write_loop(self, conn: Connection, queue: asyncio.Queue):
+        while True:
+            frame = await queue.get()
+            if frame is None:
+                return
+            try:
+                await self._send_frame_now(conn.websocket, frame)
+            except Exception as e:
+                logger.error(f"Error sending message: {e}")
+                self.close_writer(conn)
+                await self.cleanup_disconnected(conn.websocket)
+                return
+
+
+
+    async def evict(self, websocket: WebSocket, code: int = 1013):
+        if code == 1013:
+            logger.warning("Closing connection that fell too far behind")
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+        await self.cleanup_disconnected(websocket)
+
+
 
     async def cleanup_disconnected(self, websocket: WebSocket):
-        if websocket in self.connection_info:
+        if websocket in self.connections:
             await self.disconnect(websocket)
\ No newline at end of file
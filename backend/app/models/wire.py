@@ -0,0 +1,121 @@
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from decouple import config
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+Frame = Union[str, bytes]
+
+COMPRESS_THRESHOLD = int(config("COLLAB_COMPRESS_THRESHOLD", default="16384"))
+COMPRESS_LEVEL = int(config("COLLAB_COMPRESS_LEVEL", default="6"))
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def encode_json(message: Dict[str, Any]) -> str:
+    """Encode a message as a JSON text frame, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"))
+
+
+def decode_json(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message: Dict[str, Any]) -> str:
+        return encode_json(message)
+
+    def decode(self, data: Frame) -> Any:
+        try:
+            return decode_json(data)
+        except ValueError as e:
+            raise DecodeError("Invalid JSON format") from e
+
+
+class MsgpackCodec:
+    """Binary frames. Ops and cursor messages are mostly small ints and short
+    strings, which MessagePack stores in a byte or two instead of JSON text."""
+
+    name = "msgpack"
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Frame) -> Any:
+        if isinstance(data, str):
+            # Clients may still send plain JSON text frames
+            return JSON_CODEC.decode(data)
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, TypeError) as e:
+            raise DecodeError("Invalid MessagePack frame") from e
+
+
+class ZlibCodec:
+    """Deflates frames of at least `threshold` bytes into binary frames.
+
+    Smaller frames pass through untouched. JSON clients treat every binary
+    frame as compressed JSON. MessagePack clients recognise compressed frames
+    by the zlib header byte 0x78, which can never start a MessagePack map.
+    """
+
+    def __init__(self, inner, threshold: int = COMPRESS_THRESHOLD, level: int = COMPRESS_LEVEL) -> None:
+        self.inner = inner
+        self.name = f"{inner.name}+zlib"
+        self.threshold = threshold
+        self.level = level
+
+    def encode(self, message: Dict[str, Any]) -> Frame:
+        frame = self.inner.encode(message)
+        if len(frame) < self.threshold:
+            return frame
+        return zlib.compress(frame.encode() if isinstance(frame, str) else frame, self.level)
+
+    def decode(self, data: Frame) -> Any:
+        return self.inner.decode(data)
+
+
+JSON_CODEC = JsonCodec()
+CODECS = {"json": JSON_CODEC}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+COMPRESSED_CODECS = {name: ZlibCodec(codec) for name, codec in CODECS.items()}
+
+SUBPROTOCOL_PREFIX = "smartnotes."
+
+
+def negotiate_codec(encoding: Optional[str], subprotocols: Iterable[str],
+                    compress: Optional[str] = None) -> Tuple[Any, Optional[str]]:
+    """Pick a codec from the `encoding` query parameter or the client's
+    Sec-WebSocket-Protocol offers ("smartnotes.msgpack", "smartnotes.json").
+    `compress="zlib"` additionally deflates large frames.
+
+    Returns the codec and the subprotocol to accept, if any. Unknown or
+    unavailable encodings fall back to JSON.
+    """
+    codecs = COMPRESSED_CODECS if compress == "zlib" else CODECS
+
+    for subprotocol in subprotocols:
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX):
+            codec = codecs.get(subprotocol[len(SUBPROTOCOL_PREFIX):])
+            if codec is not None:
+                return codec, subprotocol
+
+    return codecs.get(encoding or "json", codecs["json"]), None
@@ -0,0 +1,193 @@
+from typing import Dict, List
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import hashlib
+import json
+import logging
+import queue
+import random
+import re
+import time
+
+# Fraction of statements logged (0 to 1); slow statements are always logged
+SQL_LOG_SAMPLE_RATE = float(config("SQL_LOG_SAMPLE_RATE", default="0"))
+SQL_SLOW_QUERY_MS = float(config("SQL_SLOW_QUERY_MS", default="500"))
+# Log records waiting for the writer thread; further records are dropped
+SQL_LOG_QUEUE_SIZE = int(config("SQL_LOG_QUEUE_SIZE", default="10000"))
+# Distinct normalized statements timed for /metrics/queries
+SQL_STATS_MAX_STATEMENTS = int(config("SQL_STATS_MAX_STATEMENTS", default="500"))
+
+logger = logging.getLogger("app.sql")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s")
+# A parenthesized list of parameters, each with an optional ::TYPE cast
+_LIST = re.compile(r"\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+    """`statement` with literals and bind parameters replaced by ?, IN
+    lists collapsed and whitespace squeezed, so that the same query with
+    different values, or a different number of values, normalizes the same."""
+    sql = _STRING.sub("?", statement)
+    sql = _PARAMETER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest()
+
+
+class JsonMessage:
+    """Log message rendered as JSON only when a handler formats it."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: Dict) -> None:
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps(self.fields, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without blocking the event loop.
+    When the writer falls behind, records are dropped and counted instead."""
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        # QueueHandler.prepare formats the record here, on the event loop.
+        # Records stay in this process, so the writer thread can format them.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueryLog:
+    """Per-statement timing from engine events.
+
+    Every statement updates the aggregate in `stats()`. Statements slower
+    than SQL_SLOW_QUERY_MS, and a SQL_LOG_SAMPLE_RATE sample of the rest,
+    are written to the app.sql logger as one JSON object per line, without
+    bind parameters. The event loop only builds the fields; JSON encoding,
+    formatting and I/O happen on a writer thread.
+    """
+
+    def __init__(self, sample_rate: float = SQL_LOG_SAMPLE_RATE, slow_ms: float = SQL_SLOW_QUERY_MS,
+                 queue_size: int = SQL_LOG_QUEUE_SIZE, max_statements: int = SQL_STATS_MAX_STATEMENTS) -> None:
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        # Key: normalized SQL; value: [count, total_ms, max_ms, slow]
+        self.statements: Dict[str, List[float]] = {}
+        self.untracked = 0
+
+        self.handler = DroppingQueueHandler(queue_size)
+        writer = logging.StreamHandler()
+        writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        self.listener = QueueListener(self.handler.queue, writer)
+        self.running = False
+        logger.addHandler(self.handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    def instrument(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+
+    def start(self):
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self):
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self._record(statement, context, executemany, None, cursor.rowcount)
+
+    def _error(self, context):
+        if context.execution_context is not None and context.statement is not None:
+            self._record(context.statement, context.execution_context, False, context.original_exception, None)
+
+    def _record(self, statement, context, executemany, error, rowcount):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        context._query_started = None
+
+        sql = normalize(statement)
+        slow = elapsed_ms >= self.slow_ms > 0
+        entry = self.statements.get(sql)
+        if entry is None:
+            if len(self.statements) >= self.max_statements:
+                self.untracked += 1
+            else:
+                self.statements[sql] = [1, elapsed_ms, elapsed_ms, int(slow)]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            entry[2] = max(entry[2], elapsed_ms)
+            entry[3] += slow
+
+        if error is None and not slow and not (self.sample_rate and random.random() < self.sample_rate):
+            return
+        fields = {
+            "event": "error" if error is not None else "slow" if slow else "sample",
+            "ms": round(elapsed_ms, 3),
+            "fingerprint": fingerprint(sql),
+            "rows": rowcount,
+            "executemany": executemany,
+            "sql": sql,
+        }
+        if error is not None:
+            fields["error"] = type(error).__name__
+        level = logging.WARNING if error is not None or slow else logging.INFO
+        logger.log(level, JsonMessage(fields))
+
+    def stats(self, limit: int = 20) -> Dict:
+        """The `limit` statements with the most total time."""
+        top = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "dropped_log_records": self.handler.dropped,
+            "untracked_executions": self.untracked,
+            "statements": [
+                {
+                    "fingerprint": fingerprint(sql),
+                    "sql": sql,
+                    "count": count,
+                    "total_ms": round(total, 3),
+                    "avg_ms": round(total / count, 3),
+                    "max_ms": round(longest, 3),
+                    "slow": slow,
+                }
+                for sql, (count, total, longest, slow) in top
+            ],
+        }
+
+
+query_log = QueryLog()
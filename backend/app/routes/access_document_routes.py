@@ -1,38 +1,82 @@
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, selectinload
-from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session, defer, selectinload
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import or_
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.models import AccessDocument, User
+from app.models.models import AccessDocument, Document, User
 from app.db import get_db
+from app.auth.auth_schema import TokenData
+from app.auth.jwt_helper import get_current_user, require_user
+from app.models.permissions import OWNER, VIEW, permissions
+from app.models.pagination import PageParams, finish_page, paginate
+from app.models.tree_cache import tree_cache
 from app.schemas.access_document import AccessDocumentCreate, AccessDocumentResponse, PermissionTypeEnum
+from app.schemas.document_schema import DocumentMeta
+from typing import List, Optional
 
 router = APIRouter(
     prefix="/access_document",
     tags=["Access Document"],
+    dependencies=[Depends(get_current_user)],
     responses={404: {"description": "Not found"}},
 )
 
 
 @router.get("/")
-async def get_access_document(db: AsyncSession = Depends(get_db)):
-    query = select(AccessDocument)
-    result = await db.execute(query)
+async def get_access_document(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    # Grants given to the user, and grants on the user's own documents
+    query = select(AccessDocument).where(
+        or_(
+            AccessDocument.user_id == current_user.user_id,
+            AccessDocument.doc_id.in_(
+                select(Document.doc_id).where(Document.user_id == current_user.user_id)
+            ),
+        )
+    )
+    result = await db.execute(
+        paginate(query, AccessDocument.updated_at, AccessDocument.access_doc_id, page)
+    )
     access_document = result.scalars().all()
-    return access_document
+    return finish_page(access_document, response, page, "access_doc_id")
     
     
-@router.get("/user/{user_id}")
-async def get_access_document_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(AccessDocument.document).where(AccessDocument.user_id == user_id)
-    result = await db.execute(query)
+@router.get("/user/{user_id}", response_model=List[DocumentMeta])
+async def get_access_document_user(
+    user_id: int,
+    response: Response,
+    starred: Optional[bool] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    require_user(current_user, user_id)
+    query = (
+        select(Document)
+        .options(defer(Document.content))
+        .join(AccessDocument, AccessDocument.doc_id == Document.doc_id)
+        .where(AccessDocument.user_id == user_id)
+    )
+    if starred is not None:
+        query = query.where(Document.is_stared == starred)
+    result = await db.execute(paginate(query, Document.updated_at, Document.doc_id, page))
     access_document = result.scalars().all()
-    return access_document
+    return finish_page(access_document, response, page, "doc_id")
 
 
 @router.get("/document/{doc_id}")
-async def get_access_document_document(doc_id: str, db: AsyncSession = Depends(get_db)):
+async def get_access_document_document(
+    doc_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    await permissions.require(current_user.user_id, doc_id, VIEW, db)
     query = (
         select(AccessDocument)
         .options(selectinload(AccessDocument.user))
@@ -58,7 +102,8 @@ async def get_access_document_document(doc_id: str, db: AsyncSession = Depends(g
 @router.post("/", response_model=AccessDocumentResponse)
 async def create_access_document(
         access_document: AccessDocumentCreate,
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_db),
+        current_user: TokenData = Depends(get_current_user),
 ):
     try:
         doc_id = access_document.doc_id
@@ -78,6 +123,9 @@ async def create_access_document(
                 detail="Document ID is required"
             )
 
+        # Sharing takes owner permission: the document's owner or an owner grant
+        await permissions.require(current_user.user_id, doc_id, OWNER, db)
+
         if isinstance(permission, PermissionTypeEnum):
             permission = permission.value
 
@@ -107,6 +155,8 @@ async def create_access_document(
             db.add(new_access)
             await db.commit()
             await db.refresh(new_access)
+            permissions.invalidate(doc_id, user.user_id)
+            await tree_cache.invalidate(user.user_id)
             return AccessDocumentResponse.model_validate(new_access)
 
         except IntegrityError as e:
@@ -1,29 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import Integer, literal
 from sqlalchemy.future import select
+from sqlalchemy.orm import defer
 from app.models.models import Directory, Document, AccessDocument, User
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
+from app.auth.auth_schema import TokenData
+from app.auth.jwt_helper import get_current_user, require_user
+from app.models.permissions import permissions
+from app.models.pagination import PageParams, finish_page, paginate
+from app.models.tree_cache import document_grantees, etag_matches, make_etag, tree_cache, tree_view
+from app.models.wire import encode_json
 from app.schemas.directory_schema import DirectoryCreate, DirectoryUpdate
+from typing import Optional
 
 router = APIRouter(
     prefix="/directories",
     tags=["directories"],
+    dependencies=[Depends(get_current_user)],
     responses={404: {"description": "Not found"}},
 )
 
 
 @router.get("/{user_id}")
-async def get_directories(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_directories(
+    user_id: int,
+    response: Response,
+    starred: Optional[bool] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    require_user(current_user, user_id)
     query = select(Directory).where(Directory.user_id == user_id)
-    result = await db.execute(query)
+    if starred is not None:
+        query = query.where(Directory.is_stared == starred)
+    result = await db.execute(paginate(query, Directory.updated_at, Directory.dir_id, page))
     directories = result.scalars().all()
-    return directories
+    return finish_page(directories, response, page, "dir_id")
 
 
 @router.post("/")
 async def create_directory(
-    directory: DirectoryCreate, db: AsyncSession = Depends(get_db)
+    directory: DirectoryCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
+    require_user(current_user, directory.user_id)
     try:
         query = select(Directory).where(Directory.user_id == directory.user_id)
         result = await db.execute(query)
@@ -38,6 +61,7 @@ async def create_directory(
         db.add(new_directory)
         await db.commit()
         await db.refresh(new_directory)
+        await tree_cache.invalidate(new_directory.user_id)
         return new_directory
     
     except HTTPException as http_exc:
@@ -53,7 +77,10 @@ async def create_directory(
 
 @router.put("/{dir_id}")
 async def update_directory(
-    dir_id: str, directory_update: DirectoryUpdate, db: AsyncSession = Depends(get_db)
+    dir_id: str,
+    directory_update: DirectoryUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
     result = await db.execute(select(Directory).where(Directory.dir_id == dir_id))
     directory = result.scalar_one_or_none()
@@ -62,6 +89,7 @@ async def update_directory(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
         )
+    require_user(current_user, directory.user_id)
 
     update_data = directory_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
@@ -69,21 +97,41 @@ async def update_directory(
 
     await db.commit()
     await db.refresh(directory)
+    await tree_cache.invalidate(directory.user_id)
 
     return directory
 
 
 
 @router.delete("/{dir_id}")
-async def delete_directory(dir_id: str, db: AsyncSession = Depends(get_db)):
+async def delete_directory(
+    dir_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
     result = await db.execute(select(Directory).where(Directory.dir_id == dir_id))
     directory = result.scalar_one_or_none()
 
     if not directory:
         return {"error": "Directory not found"}
+    require_user(current_user, directory.user_id)
+
+    # Documents anywhere below are deleted too, and drop out of shared trees
+    subtree = (
+        select(Directory.dir_id).where(Directory.dir_id == dir_id).cte("subtree", recursive=True)
+    )
+    subtree = subtree.union_all(
+        select(Directory.dir_id).join(subtree, Directory.parent_id == subtree.c.dir_id)
+    )
+    in_subtree = Document.directory_id.in_(select(subtree.c.dir_id))
+    grantees = await document_grantees(db, in_subtree)
+    doc_result = await db.execute(select(Document.doc_id).where(in_subtree))
+    doc_ids = doc_result.scalars().all()
 
     await db.delete(directory)
     await db.commit()
+    permissions.invalidate_documents(doc_ids)
+    await tree_cache.invalidate(directory.user_id, *grantees)
 
     return {"message": f"Directory {dir_id} deleted successfully"}
 
@@ -91,22 +139,64 @@ async def delete_directory(dir_id: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/tree/{user_id}")
-async def get_file_tree(user_id: int, db: AsyncSession = Depends(get_db)):
-    
-    
-    dir_result = await db.execute(
-        select(Directory).where(Directory.user_id == user_id)
-    )
-    directories = dir_result.scalars().all()
-    
-    doc_result = await db.execute(
-        select(Document).where(Document.user_id == user_id)
-    )
+async def get_file_tree(
+    user_id: int,
+    root_id: Optional[str] = None,
+    depth: Optional[int] = Query(None, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    """Directory tree of a user, served from the tree cache when possible.
+
+    Responses carry an ETag; a request whose If-None-Match still matches
+    gets 304 Not Modified with no body.
+    """
+    require_user(current_user, user_id)
+    view = tree_view(root_id, depth)
+    generation, cached = await tree_cache.lookup(user_id, view)
+    if cached is None:
+        tree = await build_file_tree(db, user_id, root_id, depth)
+        body = encode_json(tree).encode()
+        etag = make_etag(body)
+        await tree_cache.store(user_id, view, generation, etag, body)
+    else:
+        etag, body = cached
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def build_file_tree(
+    db: AsyncSession, user_id: int, root_id: Optional[str] = None, depth: Optional[int] = None
+):
+    """Directory tree of a user, built from at most three queries.
+
+    Starts at the top-level directories, or at `root_id` to load a subtree.
+    `depth` limits how many levels below the starting directories are
+    loaded; folders at the limit come back with `children: null` so the
+    client can fetch them later with `root_id`. Shared documents are only
+    included in the full tree.
+    """
+    directories_query, documents_query = file_tree_queries(user_id, root_id, depth)
+    dir_result = await db.execute(directories_query)
+    directories = dir_result.all()
+
+    if root_id is not None and not directories:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
+        )
+
+    doc_result = await db.execute(documents_query)
     documents = doc_result.scalars().all()
+    permissions.prime_owned(user_id, documents)
     
     # Build directory map
     dir_map = {}
-    for directory in directories:
+    root_directories = []
+    for directory, level in directories:
         dir_data = {
             "id": directory.dir_id,
             "name": directory.dir_name,
@@ -116,26 +206,22 @@ async def get_file_tree(user_id: int, db: AsyncSession = Depends(get_db)):
             "created_at": directory.created_at.isoformat() if directory.created_at else None,
             "updated_at": directory.updated_at.isoformat() if directory.updated_at else None,
             "color": directory.color,
-            "children": []
+            "children": [] if depth is None or level < depth else None
         }
         dir_map[directory.dir_id] = dir_data
-    
-    
-    root_directories = []
-    for dir_id, dir_data in dir_map.items():
-        if dir_data["parent_id"] is None:
+        if level == 0:
             root_directories.append(dir_data)
-        else:
-            parent_id = dir_data["parent_id"]
-            if parent_id in dir_map:
-                dir_map[parent_id]["children"].append(dir_data)
+    
+    for dir_data in dir_map.values():
+        parent = dir_map.get(dir_data["parent_id"])
+        if parent is not None and parent["children"] is not None:
+            parent["children"].append(dir_data)
     
 
     for document in documents:
         doc_data = {
             "id": document.doc_id,
             "name": document.doc_name,
-            "content": document.content,
             "is_stared": document.is_stared,
             "type": "document",
             "directory_id": document.directory_id,
@@ -148,43 +234,84 @@ async def get_file_tree(user_id: int, db: AsyncSession = Depends(get_db)):
             dir_map[directory_id]["children"].append(doc_data)
     
 
-    access_result = await db.execute(
-        select(AccessDocument, Document)
-        .join(Document, AccessDocument.doc_id == Document.doc_id)
-        .where(
-            AccessDocument.user_id == user_id,
-            Document.user_id != user_id
-        )
-    )
+    result = {
+        "user_id": user_id,
+        "owned_structure": root_directories,
+    }
+    if root_id is not None:
+        result["root_id"] = root_id
+        return result
+
+    access_result = await db.execute(shared_documents_query(user_id))
     shared_documents = access_result.all()
+    for access_doc, document, _ in shared_documents:
+        permissions.prime(user_id, document.doc_id, access_doc.permission)
     
     # Create shared documents section
     shared_docs_list = []
-    for access_doc, document in shared_documents:
-        
-        user = await db.execute(
-            select(User).where(User.user_id == document.user_id)
-        )
-        user = user.scalar_one()
+    for access_doc, document, owner_email in shared_documents:
         doc_data = {
             "id": document.doc_id,
             "name": document.doc_name,
-            "content": document.content,
             "type": "document",
             "is_stared": document.is_stared,
             "access_type": "shared",
             "permission_type": access_doc.permission,
-            "owner_email": user.email,
+            "owner_email": owner_email,
             "shared_at": access_doc.created_at.isoformat() if access_doc.created_at else None,
             "created_at": document.created_at.isoformat() if document.created_at else None,
             "updated_at": document.updated_at.isoformat() if document.updated_at else None
         }
         shared_docs_list.append(doc_data)
 
-    result = {
-        "user_id": user_id,
-        "owned_structure": root_directories,
-        "shared_documents": shared_docs_list
-    }
-    
+    result["shared_documents"] = shared_docs_list
     return result
+
+
+def file_tree_queries(user_id: int, root_id: Optional[str] = None, depth: Optional[int] = None):
+    """The directory and document queries behind build_file_tree."""
+    # Recursive CTE over parent_id, tagging each directory with its level
+    if root_id is None:
+        start = Directory.parent_id == None
+    else:
+        start = Directory.dir_id == root_id
+    tree = (
+        select(Directory.dir_id, literal(0, Integer).label("level"))
+        .where(Directory.user_id == user_id, start)
+        .cte("tree", recursive=True)
+    )
+    descend = (
+        select(Directory.dir_id, (tree.c.level + 1).label("level"))
+        .join(tree, Directory.parent_id == tree.c.dir_id)
+        .where(Directory.user_id == user_id)
+    )
+    if depth is not None:
+        descend = descend.where(tree.c.level < depth)
+    tree = tree.union_all(descend)
+
+    directories_query = select(Directory, tree.c.level).join(tree, Directory.dir_id == tree.c.dir_id)
+
+    # Content is fetched per document from /documents/{doc_id}/content
+    loaded = select(tree.c.dir_id)
+    if depth is not None:
+        loaded = loaded.where(tree.c.level < depth)
+    documents_query = (
+        select(Document)
+        .options(defer(Document.content))
+        .where(Document.user_id == user_id, Document.directory_id.in_(loaded))
+    )
+    return directories_query, documents_query
+
+
+def shared_documents_query(user_id: int):
+    # Owners are joined in, not looked up per document
+    return (
+        select(AccessDocument, Document, User.email)
+        .options(defer(Document.content))
+        .join(Document, AccessDocument.doc_id == Document.doc_id)
+        .join(User, User.user_id == Document.user_id)
+        .where(
+            AccessDocument.user_id == user_id,
+            Document.user_id != user_id
+        )
+    )
@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import defer
 from app.models.models import Document, Directory
 from app.db import get_db
+from app.auth.auth_schema import TokenData
+from app.auth.jwt_helper import get_current_user, require_user
+from app.models.document_cache import document_cache
+from app.models.document_search import search_documents_indexed, search_documents_query
+from app.models.document_text import marked_html
+from app.models.inverted_index import search_index
+from app.models.permissions import EDIT, OWNER, VIEW, permissions
+from app.models.pagination import MAX_PAGE_SIZE, PageParams, finish_page, paginate
+from app.models.revision_store import record_revision
+from app.models.tree_cache import document_grantees, tree_cache
 from app.schemas.document_schema import (
     DocumentCreate,
     DocumentUpdate,
     DocumentOut,
+    DocumentMeta,
+    DocumentSearchHit,
     DocumentContent,
 )
 from typing import List, Optional
@@ -16,12 +29,18 @@ from sqlalchemy import and_
 router = APIRouter(
     prefix="/documents",
     tags=["documents"],
+    dependencies=[Depends(get_current_user)],
     responses={404: {"description": "Not found"}},
 )
 
 
 @router.post("/", response_model=DocumentOut)
-async def create_document(document: DocumentCreate, db: AsyncSession = Depends(get_db)):
+async def create_document(
+    document: DocumentCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    require_user(current_user, document.user_id)
     try:
         query = select(Document).where(
             and_(
@@ -42,6 +61,8 @@ async def create_document(document: DocumentCreate, db: AsyncSession = Depends(g
         db.add(new_document)
         await db.commit()
         await db.refresh(new_document)
+        search_index.update(new_document.doc_id, new_document.content)
+        await tree_cache.invalidate(new_document.user_id)
         return new_document
     except HTTPException as e:
         raise e
@@ -50,8 +71,39 @@ async def create_document(document: DocumentCreate, db: AsyncSession = Depends(g
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.get("/search", response_model=List[DocumentSearchHit])
+async def search_documents(
+    user_id: int,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    """Full-text search over the documents a user owns or has been shared.
+
+    Results are ranked by relevance, so pages use limit/offset; the next
+    offset is returned in the X-Next-Offset header while more results remain.
+    """
+    require_user(current_user, user_id)
+    if search_index.enabled:
+        hits = await search_documents_indexed(db, user_id, q, limit + 1, offset)
+    else:
+        result = await db.execute(search_documents_query(user_id, q, limit + 1, offset))
+        hits = [{**row._mapping, "snippet": marked_html(row.snippet)} for row in result.all()]
+    if len(hits) > limit:
+        hits = hits[:limit]
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return hits
+
+
 @router.get("/{doc_id}", response_model=DocumentOut)
-async def get_document(doc_id: str, db: AsyncSession = Depends(get_db)):
+async def get_document(
+    doc_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
     result = await db.execute(select(Document).where(Document.doc_id == doc_id))
     document = result.scalar_one_or_none()
 
@@ -59,13 +111,17 @@ async def get_document(doc_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
+    await permissions.require(current_user.user_id, doc_id, VIEW, db, owner_id=document.user_id)
 
     return document
 
 
 @router.put("/{doc_id}", response_model=DocumentOut)
 async def update_document(
-    doc_id: str, document_update: DocumentUpdate, db: AsyncSession = Depends(get_db)
+    doc_id: str,
+    document_update: DocumentUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
     result = await db.execute(select(Document).where(Document.doc_id == doc_id))
     document = result.scalar_one_or_none()
@@ -75,16 +131,43 @@ async def update_document(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
 
-    for key, value in document_update.dict(exclude_unset=True).items():
+    update_data = document_update.dict(exclude_unset=True)
+    # Moving between folders is the owner's call, like /move
+    moving = update_data.get("directory_id", document.directory_id) != document.directory_id
+    await permissions.require(
+        current_user.user_id, doc_id, OWNER if moving else EDIT, db, owner_id=document.user_id
+    )
+    if moving:
+        dir_result = await db.execute(
+            select(Directory.user_id).where(Directory.dir_id == update_data["directory_id"])
+        )
+        # Documents stay in their owner's folders
+        if dir_result.scalar_one_or_none() != document.user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Target directory not found"
+            )
+    for key, value in update_data.items():
         setattr(document, key, value)
 
+    if "content" in update_data:
+        await record_revision(db, doc_id, document.content)
     await db.commit()
+    document_cache.invalidate(doc_id)
     await db.refresh(document)
+    if "content" in update_data:
+        search_index.update(doc_id, document.content)
+    await tree_cache.invalidate(
+        document.user_id, *await document_grantees(db, Document.doc_id == doc_id)
+    )
     return document
 
 
 @router.delete("/{doc_id}")
-async def delete_document(doc_id: str, db: AsyncSession = Depends(get_db)):
+async def delete_document(
+    doc_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
     result = await db.execute(select(Document).where(Document.doc_id == doc_id))
     document = result.scalar_one_or_none()
 
@@ -92,34 +175,36 @@ async def delete_document(doc_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
+    await permissions.require(current_user.user_id, doc_id, OWNER, db, owner_id=document.user_id)
 
+    grantees = await document_grantees(db, Document.doc_id == doc_id)
     await db.delete(document)
     await db.commit()
+    document_cache.invalidate(doc_id)
+    permissions.invalidate(doc_id)
+    search_index.remove(doc_id)
+    await tree_cache.invalidate(document.user_id, *grantees)
     return {"message": f"Document {doc_id} deleted successfully"}
 
 
-@router.get("/directory/{directory_id}", response_model=List[DocumentOut])
+@router.get("/directory/{directory_id}", response_model=List[DocumentMeta])
 async def get_documents_by_directory(
-    directory_id: str, db: AsyncSession = Depends(get_db)
+    directory_id: str,
+    response: Response,
+    starred: Optional[bool] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
     """Get all documents in a specific directory"""
     # Handle root as a special case
     if directory_id == "root":
-        # Get all top-level directories
-        dir_result = await db.execute(
-            select(Directory).where(Directory.parent_id == None)
-        )
-        directories = dir_result.scalars().all()
-
-        # Get documents in those directories
-        if directories:
-            dir_ids = [directory.dir_id for directory in directories]
-            doc_result = await db.execute(
-                select(Document).where(Document.directory_id.in_(dir_ids))
+        # Documents in any of the user's top-level directories
+        in_directory = Document.directory_id.in_(
+            select(Directory.dir_id).where(
+                Directory.parent_id == None, Directory.user_id == current_user.user_id
             )
-            documents = doc_result.scalars().all()
-        else:
-            documents = []
+        )
     else:
         # Verify directory exists
         dir_result = await db.execute(
@@ -131,19 +216,47 @@ async def get_documents_by_directory(
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
             )
+        require_user(current_user, directory.user_id)
+
+        in_directory = Document.directory_id == directory_id
+
+    query = select(Document).options(defer(Document.content)).where(in_directory)
+    if starred is not None:
+        query = query.where(Document.is_stared == starred)
+    doc_result = await db.execute(paginate(query, Document.updated_at, Document.doc_id, page))
+    documents = doc_result.scalars().all()
+    permissions.prime_owned(current_user.user_id, documents)
+
+    return finish_page(documents, response, page, "doc_id")
+
 
-        # Get documents in the directory
-        doc_result = await db.execute(
-            select(Document).where(Document.directory_id == directory_id)
+@router.get("/{doc_id}/content", response_model=DocumentContent)
+async def get_document_content(
+    doc_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    """Get only the content of a document"""
+    result = await db.execute(
+        select(Document.content, Document.user_id).where(Document.doc_id == doc_id)
+    )
+    row = result.first()
+
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
-        documents = doc_result.scalars().all()
+    await permissions.require(current_user.user_id, doc_id, VIEW, db, owner_id=row.user_id)
 
-    return documents
+    return {"content": row.content or ""}
 
 
 @router.put("/{doc_id}/content", response_model=DocumentOut)
 async def update_document_content(
-    doc_id: str, content_update: DocumentContent, db: AsyncSession = Depends(get_db)
+    doc_id: str,
+    content_update: DocumentContent,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
     """Update only the content of a document"""
     result = await db.execute(select(Document).where(Document.doc_id == doc_id))
@@ -153,17 +266,27 @@ async def update_document_content(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
+    await permissions.require(current_user.user_id, doc_id, EDIT, db, owner_id=document.user_id)
 
     document.content = content_update.content
+    await record_revision(db, doc_id, document.content)
     await db.commit()
+    document_cache.invalidate(doc_id)
     await db.refresh(document)
+    search_index.update(doc_id, document.content)
+    await tree_cache.invalidate(
+        document.user_id, *await document_grantees(db, Document.doc_id == doc_id)
+    )
 
     return document
 
 
 @router.put("/{doc_id}/move", response_model=DocumentOut)
 async def move_document(
-    doc_id: str, new_directory_id: str, db: AsyncSession = Depends(get_db)
+    doc_id: str,
+    new_directory_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
 ):
     """Move a document to a different directory"""
     # Get the document to move
@@ -174,12 +297,15 @@ async def move_document(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
+    await permissions.require(current_user.user_id, doc_id, OWNER, db, owner_id=document.user_id)
 
     # Handle root as a special case
     if new_directory_id == "root":
-        # Find first top-level directory or create one
+        # Find the owner's first top-level directory or create one
         dir_result = await db.execute(
-            select(Directory).where(Directory.parent_id == None)
+            select(Directory)
+            .where(Directory.parent_id == None, Directory.user_id == document.user_id)
+            .limit(1)
         )
         directory = dir_result.scalar_one_or_none()
 
@@ -203,7 +329,8 @@ async def move_document(
     )
     directory = dir_result.scalar_one_or_none()
 
-    if not directory:
+    # Documents stay in their owner's folders
+    if not directory or directory.user_id != document.user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Target directory not found"
         )
@@ -228,13 +355,26 @@ async def move_document(
     document.directory_id = new_directory_id
     await db.commit()
     await db.refresh(document)
+    await tree_cache.invalidate(document.user_id)
 
     return document
 
 
-@router.get("/user/{user_id}", response_model=List[DocumentOut])
-async def get_all_user_documents(user_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/user/{user_id}", response_model=List[DocumentMeta])
+async def get_all_user_documents(
+    user_id: int,
+    response: Response,
+    starred: Optional[bool] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
     """Get all documents for a specific user"""
-    result = await db.execute(select(Document).where(Document.user_id == user_id))
+    require_user(current_user, user_id)
+    query = select(Document).options(defer(Document.content)).where(Document.user_id == user_id)
+    if starred is not None:
+        query = query.where(Document.is_stared == starred)
+    result = await db.execute(paginate(query, Document.updated_at, Document.doc_id, page))
     documents = result.scalars().all()
-    return documents
+    permissions.prime_owned(user_id, documents)
+    return finish_page(documents, response, page, "doc_id")
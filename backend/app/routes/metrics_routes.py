@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from decouple import config
+from typing import Optional
+import hmac
+
+from app.db import pool_stats
+from app.query_log import query_log
+from app.auth.password_hasher import password_hasher
+
+# Shared secret for scrapers and operators. Unset, the endpoints do not
+# exist; they expose normalized SQL and capacity figures, not user data.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(require_metrics_token)],
+    include_in_schema=False,
+)
+
+
+@router.get("/pool")
+async def database_pool():
+    return pool_stats()
+
+
+@router.get("/queries")
+async def database_queries(limit: int = Query(20, ge=1, le=500)):
+    return query_log.stats(limit)
+
+
+@router.get("/passwords")
+async def password_hashing():
+    return password_hasher.stats()
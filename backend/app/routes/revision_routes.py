@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.models import DocumentRevision
+from app.models.revision_store import compute_delta, reconstruct
+from app.db import get_db
+from app.auth.auth_schema import TokenData
+from app.auth.jwt_helper import get_current_user
+from app.models.pagination import PageParams, finish_page, paginate
+from app.models.permissions import VIEW, permissions
+from app.schemas.revision_schema import RevisionOut, RevisionContent, RevisionDiff
+from typing import List
+
+
+async def can_view_document(
+    doc_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    await permissions.require(current_user.user_id, doc_id, VIEW, db)
+
+
+router = APIRouter(
+    prefix="/documents",
+    tags=["revisions"],
+    dependencies=[Depends(can_view_document)],
+    responses={404: {"description": "Not found"}},
+)
+
+
+async def get_revision_content(db: AsyncSession, doc_id: str, revision: int):
+    reconstructed = await reconstruct(db, doc_id, revision)
+    if reconstructed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Revision {revision} not found"
+        )
+    return reconstructed
+
+
+@router.get("/{doc_id}/revisions", response_model=List[RevisionOut])
+async def list_revisions(
+    doc_id: str,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    """List the revisions of a document, newest first, one page at a time;
+    `updated_since` filters on when the revision was recorded"""
+    query = (
+        select(DocumentRevision.revision, DocumentRevision.is_snapshot, DocumentRevision.created_at)
+        .where(DocumentRevision.doc_id == doc_id)
+    )
+    result = await db.execute(paginate(query, DocumentRevision.created_at, DocumentRevision.revision, page))
+    return finish_page(result.all(), response, page, "revision", updated="created_at")
+
+
+@router.get("/{doc_id}/revisions/diff", response_model=RevisionDiff)
+async def diff_revisions(
+    doc_id: str, from_revision: int, to_revision: int, db: AsyncSession = Depends(get_db)
+):
+    """Ops that turn one revision into another"""
+    old_content, _ = await get_revision_content(db, doc_id, from_revision)
+    new_content, _ = await get_revision_content(db, doc_id, to_revision)
+    return RevisionDiff(
+        doc_id=doc_id,
+        from_revision=from_revision,
+        to_revision=to_revision,
+        ops=compute_delta(old_content, new_content),
+    )
+
+
+@router.get("/{doc_id}/revisions/{revision}", response_model=RevisionContent)
+async def get_revision(doc_id: str, revision: int, db: AsyncSession = Depends(get_db)):
+    content, row = await get_revision_content(db, doc_id, revision)
+    return RevisionContent(
+        doc_id=doc_id, revision=revision, content=content, created_at=row.created_at
+    )
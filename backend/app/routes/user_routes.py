@@ -4,7 +4,11 @@ from sqlalchemy.future import select
 from app.models.models import User
 from app.db import get_db
 from app.schemas.user_schema import UserCreate, UserUpdate, UserOut
-from app.auth.jwt_helper import pwd_context
+from app.auth.auth_schema import TokenData
+from app.auth.jwt_helper import get_current_user, require_user
+from app.auth.password_hasher import password_hasher
+from app.auth.token_cache import token_cache
+from app.models.permissions import permissions
 
 router = APIRouter(
     prefix="/users",
@@ -14,7 +18,7 @@ router = APIRouter(
 
 @router.post("/", response_model=UserOut)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    hashed_pwd = pwd_context.hash(user.password)
+    hashed_pwd = await password_hasher.hash(user.password)
     new_user = User(
         username=user.username,
         email=user.email,
@@ -40,23 +44,40 @@ async def get_user(username: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.put("/{user_id}", response_model=UserOut)
-async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
+async def update_user(
+    user_id: int,
+    user_update: UserUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    require_user(current_user, user_id)
     result = await db.execute(select(User).where(User.user_id == user_id))
     user = result.scalar_one_or_none()
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    for key, value in user_update.model_dump(exclude_unset=True).items():
+    updates = user_update.model_dump(exclude_unset=True)
+    password = updates.pop("password", None)
+    if password:
+        user.hashed_password = await password_hasher.hash(password)
+    for key, value in updates.items():
         setattr(user, key, value)
     
     await db.commit()
     await db.refresh(user)
+    # Tokens name the user by username, which may have changed
+    token_cache.invalidate_user(user_id)
     return user
 
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_user(
+    user_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user),
+):
+    require_user(current_user, user_id)
     result = await db.execute(select(User).where(User.user_id == user_id))
     user = result.scalar_one_or_none()
 
@@ -65,4 +86,6 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     
     await db.delete(user)
     await db.commit()
+    token_cache.invalidate_user(user_id)
+    permissions.invalidate_user(user_id)
     return {"message": f"User {user_id} deleted successfully"}
@@ -1,8 +1,10 @@
 from typing import Optional
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query, status
+from app.auth.jwt_helper import authenticate_token
+from app.models.permissions import EDIT, allows, permissions
 from app.models.websocket_manager import DocumentManager
+from app.models.wire import DecodeError, negotiate_codec
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -12,21 +14,49 @@ manager = DocumentManager()
 async def websocket_endpoint(
     websocket: WebSocket,
     doc_id: str,
-    user_id: Optional[str] = Query(None),
-    user_name: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    encoding: Optional[str] = Query(None),
+    compress: Optional[str] = Query(None)
 ):
+    # Browsers cannot set headers on a WebSocket handshake, so the bearer
+    # token comes as ?token=. Closing before accept rejects the handshake.
+    if not token:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     try:
-        await manager.connect(doc_id, websocket, user_id, user_name)
+        user = await authenticate_token(token)
+        permission = await permissions.resolve(user.user_id, doc_id)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    except Exception as e:
+        # Database trouble while checking the token or permission
+        logger.error(f"WebSocket handshake failed for document {doc_id}: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+    if permission is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Opt-in binary framing via ?encoding=msgpack or the "smartnotes.msgpack" subprotocol,
+    # and app-level deflate of large init/snapshot frames via ?compress=zlib
+    codec, subprotocol = negotiate_codec(encoding, websocket.scope.get("subprotocols", []), compress)
+    try:
+        await manager.connect(doc_id, websocket, str(user.user_id), user.username, codec, subprotocol,
+                              can_edit=allows(permission, EDIT))
 
         while True:
-            message_text = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
             try:
-                message = json.loads(message_text)
+                data = frame.get("bytes")
+                message = codec.decode(data if data is not None else frame.get("text", ""))
                 await manager.handle_message(websocket, message)
-            except json.JSONDecodeError:
+            except DecodeError as e:
                 await manager.send_message(websocket, {
                     "type": "error",
-                    "message": "Invalid JSON format"
+                    "message": str(e)
                 })
             except Exception as e:
                 logger.error(f"Error handling message: {e}")
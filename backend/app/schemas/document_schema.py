@@ -28,4 +28,23 @@ class DocumentOut(DocumentBase):
     updated_at: datetime
     
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class DocumentMeta(BaseModel):
+    """Listing view of a document; fetch the body from /documents/{doc_id}/content."""
+    doc_id: str
+    doc_name: str
+    directory_id: str
+    is_stared: bool
+    user_id: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class DocumentSearchHit(DocumentMeta):
+    rank: float
+    snippet: str
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Any, Dict, List
+from datetime import datetime
+
+
+class RevisionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    revision: int
+    is_snapshot: bool
+    created_at: datetime
+
+
+class RevisionContent(BaseModel):
+    doc_id: str
+    revision: int
+    content: str
+    created_at: datetime
+
+
+class RevisionDiff(BaseModel):
+    doc_id: str
+    from_revision: int
+    to_revision: int
+    ops: List[Dict[str, Any]]
@@ -0,0 +1,73 @@
+"""CPU cost of one DocumentManager broadcast against the number of peers.
+
+Compares encoding the message once per fan-out (current behaviour) with
+encoding it once per recipient, as the old send_json path did.
+
+    uv run python -m benchmarks.bench_broadcast
+"""
+import asyncio
+import time
+
+from app.models.backplane import InProcessBackplane
+from app.models.collab_session import Connection, DocumentSession
+from app.models.websocket_manager import DocumentManager
+from app.models.wire import JSON_CODEC, encode_json
+
+ROUNDS = 200
+CONTENT = "x" * 200_000
+
+
+class NullWebSocket:
+    async def accept(self, *args, **kwargs):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self, *args, **kwargs):
+        pass
+
+
+async def run(peers: int):
+    manager = DocumentManager(backplane=InProcessBackplane())
+    session = manager.sessions["bench"] = DocumentSession("bench", 1)
+    session.content = CONTENT
+    for i in range(peers):
+        ws = NullWebSocket()
+        conn = manager.connections[ws] = Connection(ws, session, str(i), str(i), "#3b82f6", JSON_CODEC)
+        session.connections.add(conn)
+        manager.open_writer(conn)
+
+    message = {"type": "update", "content": CONTENT, "revision": 1, "user_id": "0", "user_name": "0"}
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        await manager.broadcast_local("bench", message)
+        await asyncio.sleep(0)
+    once = (time.process_time() - start) / ROUNDS
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for _ in range(peers):
+            encode_json(message)
+    per_peer = (time.process_time() - start) / ROUNDS
+
+    for conn in list(session.connections):
+        manager.close_writer(conn)
+    await asyncio.sleep(0)
+    return once, per_peer
+
+
+async def main():
+    print(f"message size: {len(encode_json({'content': CONTENT})) / 1024:.0f} KB, {ROUNDS} rounds")
+    print(f"{'peers':>6} {'encode once (ms)':>18} {'encode per peer (ms)':>22}")
+    for peers in (1, 5, 10, 20, 50, 100):
+        once, per_peer = await run(peers)
+        print(f"{peers:>6} {once * 1000:>18.3f} {per_peer * 1000:>22.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
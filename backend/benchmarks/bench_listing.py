@@ -0,0 +1,108 @@
+"""Response size and latency of the listing endpoints for a user with 10k notes.
+
+Seeds a scratch database (BENCH_DATABASE_URL, in-memory SQLite by default,
+which needs aiosqlite) and calls the routes in-process. The "full" row
+replays the old listing, which loaded and serialised every document body.
+
+    uv run python -m benchmarks.bench_listing
+"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("ALLOWED_ORIGINS", "http://localhost")
+
+from decouple import config
+from fastapi.encoders import jsonable_encoder
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base, get_db
+from app.main import app
+from app.models.models import Directory, Document, User
+from app.models.wire import encode_json
+from app.schemas.document_schema import DocumentOut
+
+DATABASE_URL = config("BENCH_DATABASE_URL", default="sqlite+aiosqlite://")
+DOCUMENTS = 10_000
+DIRECTORIES = 100
+CONTENT = "lorem ipsum dolor sit amet " * 150  # ~4 KB, a typical note
+ROUNDS = 5
+USER_ID = 1
+
+
+async def seed(session_factory):
+    async with session_factory() as session:
+        session.add(User(user_id=USER_ID, username="bench", email="bench@example.com", hashed_password="x"))
+        session.add_all(
+            Directory(dir_id=f"dir-{i}", dir_name=f"Folder {i}", user_id=USER_ID)
+            for i in range(DIRECTORIES)
+        )
+        session.add_all(
+            Document(doc_id=f"doc-{i}", doc_name=f"Note {i}", content=CONTENT,
+                     user_id=USER_ID, directory_id=f"dir-{i % DIRECTORIES}")
+            for i in range(DOCUMENTS)
+        )
+        await session.commit()
+
+
+async def full_listing(session_factory) -> bytes:
+    async with session_factory() as session:
+        result = await session.execute(select(Document).where(Document.user_id == USER_ID))
+        documents = [DocumentOut.model_validate(d, from_attributes=True) for d in result.scalars().all()]
+        return encode_json(jsonable_encoder(documents)).encode()
+
+
+async def measure(call):
+    size, best = 0, float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        size = len(await call())
+        best = min(best, time.perf_counter() - start)
+    return size, best * 1000
+
+
+async def main():
+    engine = create_async_engine(DATABASE_URL, poolclass=StaticPool)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    await seed(session_factory)
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            async def fetch(path):
+                response = await client.get(path)
+                response.raise_for_status()
+                return response.content
+
+            cases = (
+                ("user documents (full)", lambda: full_listing(session_factory)),
+                ("user documents (meta)", lambda: fetch(f"/documents/user/{USER_ID}")),
+                ("directory documents", lambda: fetch("/documents/directory/dir-0")),
+                ("file tree", lambda: fetch(f"/directories/tree/{USER_ID}")),
+                ("one document content", lambda: fetch("/documents/doc-0/content")),
+            )
+            print(f"{DOCUMENTS} documents of {len(CONTENT)} chars, best of {ROUNDS}")
+            print(f"{'endpoint':>22} {'bytes':>11} {'ms':>9}")
+            for name, call in cases:
+                size, ms = await measure(call)
+                print(f"{name:>22} {size:>11} {ms:>9.1f}")
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
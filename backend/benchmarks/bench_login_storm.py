@@ -0,0 +1,67 @@
+"""Event loop stalls during a burst of logins.
+
+Fires LOGINS concurrent bcrypt verifications while a stand-in for a
+WebSocket peer ticks every TICK seconds, and reports how late its ticks
+ran. A broadcast on that worker is delayed by the same amount. Compares
+verifying inline on the loop (the old behaviour) with PasswordHasher.
+
+    uv run python -m benchmarks.bench_login_storm
+"""
+import asyncio
+import statistics
+import time
+
+from app.auth.jwt_helper import pwd_context
+from app.auth.password_hasher import PasswordHasher
+
+LOGINS = 20
+TICK = 0.005
+PASSWORD = "correct horse battery staple"
+
+
+async def measure(verify) -> None:
+    hashed = pwd_context.hash(PASSWORD)
+    lags = []
+    done = asyncio.Event()
+
+    async def peer():
+        while not done.is_set():
+            expected = time.perf_counter() + TICK
+            await asyncio.sleep(TICK)
+            lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    async def login():
+        assert await verify(PASSWORD, hashed)
+        await asyncio.sleep(0)
+
+    ticker = asyncio.create_task(peer())
+    started = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(LOGINS)])
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker
+
+    lags.sort()
+    print(
+        f"  {LOGINS} logins in {elapsed:5.2f} s   peer lag ms: "
+        f"p50 {statistics.median(lags):7.1f}  p99 {lags[min(len(lags) - 1, int(len(lags) * 0.99))]:7.1f}  max {lags[-1]:7.1f}"
+    )
+
+
+async def main():
+    async def inline(password, hashed):
+        return pwd_context.verify(password, hashed)
+
+    print("inline on the event loop")
+    await measure(inline)
+
+    for threads in (1, 2, 4):
+        hasher = PasswordHasher(threads=threads, max_queue=LOGINS, queue_timeout=60)
+        print(f"PasswordHasher, {threads} thread(s)")
+        await measure(hasher.verify)
+        print(f"  queue wait avg {hasher.stats()['queue_seconds_avg'] * 1000:.0f} ms")
+        hasher.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""Memory per idle connection and join/leave cost of the session registry.
+
+The "dicts" columns replay the layout DocumentManager used before sessions
+(a list of sockets per document plus an info dict per socket) for comparison.
+
+    uv run python -m benchmarks.bench_registry
+"""
+from collections import defaultdict
+import time
+import tracemalloc
+
+from app.models.collab_session import Connection, DocumentSession
+from app.models.wire import JSON_CODEC
+
+SOCKETS = 10_000
+DOCUMENTS = 10
+
+
+class Socket:
+    __slots__ = ()
+
+
+def build_sessions(sockets):
+    sessions, connections = {}, {}
+    for i, ws in enumerate(sockets):
+        doc_id = str(i % DOCUMENTS)
+        session = sessions.get(doc_id)
+        if session is None:
+            session = sessions[doc_id] = DocumentSession(doc_id, 500)
+        conn = connections[ws] = Connection(ws, session, str(i), f"User {i}", "#3b82f6", JSON_CODEC)
+        session.connections.add(conn)
+    return sessions, connections
+
+
+def drop_sessions(registry, sockets):
+    _, connections = registry
+    for ws in sockets:
+        conn = connections.pop(ws)
+        conn.session.connections.discard(conn)
+
+
+def build_dicts(sockets):
+    active_connections, connection_info = defaultdict(list), {}
+    for i, ws in enumerate(sockets):
+        doc_id = str(i % DOCUMENTS)
+        connection_info[ws] = {
+            "doc_id": doc_id,
+            "user_id": str(i),
+            "user_name": f"User {i}",
+            "codec": JSON_CODEC,
+            "connected_at": time.time()
+        }
+        active_connections[doc_id].append(ws)
+    return active_connections, connection_info
+
+
+def drop_dicts(registry, sockets):
+    active_connections, connection_info = registry
+    for ws in sockets:
+        info = connection_info.pop(ws)
+        active_connections[info["doc_id"]].remove(ws)
+
+
+def measure(build, drop):
+    sockets = [Socket() for _ in range(SOCKETS)]
+
+    tracemalloc.start()
+    registry = build(sockets)
+    memory = tracemalloc.get_traced_memory()[0] / SOCKETS
+    tracemalloc.stop()
+    drop(registry, sockets)
+
+    start = time.perf_counter()
+    registry = build(sockets)
+    join_us = (time.perf_counter() - start) / SOCKETS * 1e6
+
+    start = time.perf_counter()
+    drop(registry, sockets)
+    leave_us = (time.perf_counter() - start) / SOCKETS * 1e6
+    return memory, join_us, leave_us
+
+
+def main():
+    print(f"{SOCKETS} sockets over {DOCUMENTS} documents")
+    print(f"{'layout':>9} {'bytes/conn':>11} {'join (us)':>10} {'leave (us)':>11}")
+    for name, build, drop in (("sessions", build_sessions, drop_sessions), ("dicts", build_dicts, drop_dicts)):
+        memory, join_us, leave_us = measure(build, drop)
+        print(f"{name:>9} {memory:>11.0f} {join_us:>10.2f} {leave_us:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Bytes and CPU per message for the JSON and MessagePack wire formats.
+
+    uv run python -m benchmarks.bench_wire
+"""
+import time
+
+from app.models.wire import CODECS
+
+ROUNDS = 20_000
+
+MESSAGES = {
+    "ops": {
+        "type": "ops",
+        "ops": [{"type": "insert", "position": 10482, "text": "a"}, {"type": "delete", "position": 10490, "length": 3}],
+        "revision": 5821,
+        "user_id": "42",
+        "user_name": "Jane Doe",
+        "timestamp": 1718000000000,
+    },
+    "cursors": {
+        "type": "cursors",
+        "cursors": [
+            {"user_id": str(i), "user_name": f"User {i}", "position": {"index": 1000 + i, "length": 0}, "color": "#3b82f6"}
+            for i in range(5)
+        ],
+    },
+    "ack": {"type": "ack", "revision": 5821, "seq": 17},
+}
+
+
+def measure(codec, message):
+    frame = codec.encode(message)
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        codec.encode(message)
+    encode_us = (time.process_time() - start) / ROUNDS * 1e6
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        codec.decode(frame)
+    decode_us = (time.process_time() - start) / ROUNDS * 1e6
+
+    size = len(frame.encode() if isinstance(frame, str) else frame)
+    return size, encode_us, decode_us
+
+
+def main():
+    print(f"{'message':>8} {'codec':>8} {'bytes':>6} {'encode (us)':>12} {'decode (us)':>12}")
+    for name, message in MESSAGES.items():
+        for codec in CODECS.values():
+            size, encode_us, decode_us = measure(codec, message)
+            print(f"{name:>8} {codec.name:>8} {size:>6} {encode_us:>12.2f} {decode_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ uv run alembic history
 uv run alembic current -v
 uv run alembic upgrade head
 
-# Start the FastAPI app
+# Start the FastAPI app; the app also reads WEB_CONCURRENCY to pick its tree cache.
+# With more than one worker the file tree cache and cross-worker collaboration
+# need a shared backplane: set COLLAB_BACKPLANE=postgres (or redis with
+# REDIS_URL), or TREE_CACHE_BACKEND=redis for the cache alone. Otherwise
+# every tree request is rebuilt and a warning is logged at startup.
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-4}"
 echo "Starting FastAPI with Gunicorn..."
-exec uv run gunicorn app.main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+exec uv run gunicorn app.main:app -w "$WEB_CONCURRENCY" -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
@@ -32,12 +32,20 @@ config.set_main_option("sqlalchemy.url", DATABASE_URL)
 from app.models.models import Base
 target_metadata = Base.metadata
 
+# Postgres-only objects that are deliberately not mapped on the models
+UNMAPPED_OBJECTS = {"search_vector", "ix_documents_search_vector"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (reflected and compare_to is None and name in UNMAPPED_OBJECTS)
+
 # Async migration function
 def run_migrations_offline():
     """Run migrations in 'offline' mode."""
     context.configure(
         url=DATABASE_URL,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -54,6 +62,7 @@ async def run_migrations_online():
             context.configure(
                 connection=sync_conn,
                 target_metadata=target_metadata,
+                include_object=include_object,
             )
             with context.begin_transaction():
                 context.run_migrations()
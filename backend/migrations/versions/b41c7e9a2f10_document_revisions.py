@@ -0,0 +1,39 @@
+"""document revisions
+
+Revision ID: b41c7e9a2f10
+Revises: feaf36004a45
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c7e9a2f10'
+down_revision: Union[str, None] = 'feaf36004a45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_revisions',
+    sa.Column('revision_id', sa.String(length=36), nullable=False),
+    sa.Column('doc_id', sa.String(length=36), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('delta', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['doc_id'], ['documents.doc_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('revision_id'),
+    sa.UniqueConstraint('doc_id', 'revision', name='unique_doc_revision')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('document_revisions')
@@ -0,0 +1,51 @@
+"""hot path indexes
+
+Revision ID: c7d4e1f09a3b
+Revises: b41c7e9a2f10
+Create Date: 2026-10-18 14:02:17.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d4e1f09a3b'
+down_revision: Union[str, None] = 'b41c7e9a2f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, partial index predicate)
+INDEXES = [
+    ('ix_directories_user_updated', 'directories', ['user_id', 'updated_at', 'dir_id'], None),
+    ('ix_directories_user_starred', 'directories', ['user_id', 'updated_at', 'dir_id'], 'is_stared'),
+    ('ix_directories_parent_id', 'directories', ['parent_id'], None),
+    ('ix_documents_user_updated', 'documents', ['user_id', 'updated_at', 'doc_id'], None),
+    ('ix_documents_user_starred', 'documents', ['user_id', 'updated_at', 'doc_id'], 'is_stared'),
+    ('ix_documents_directory_updated', 'documents', ['directory_id', 'updated_at', 'doc_id'], None),
+    ('ix_access_documents_user_doc', 'access_documents', ['user_id', 'doc_id'], None),
+    ('ix_access_documents_updated', 'access_documents', ['updated_at', 'access_doc_id'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY keeps the tables writable while the indexes build, and
+    # cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,87 @@
+"""document search vector
+
+Revision ID: e3a9c5d27b64
+Revises: c7d4e1f09a3b
+Create Date: 2026-10-18 16:40:03.128774
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c5d27b64'
+down_revision: Union[str, None] = 'c7d4e1f09a3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Mirrors app.models.document_text.document_text: the inserted strings of a
+# Quill Delta, embeds as a space, anything else unchanged, minus the private
+# use characters that mark snippet matches
+DOCUMENT_TEXT_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION document_text(content text) RETURNS text
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    delta jsonb;
+    words text := content;
+BEGIN
+    IF content IS NULL THEN
+        RETURN '';
+    END IF;
+    IF left(ltrim(content), 1) = '{' THEN
+        BEGIN
+            delta := content::jsonb;
+        EXCEPTION WHEN others THEN
+            delta := NULL;
+        END;
+        IF jsonb_typeof(delta -> 'ops') = 'array' THEN
+            SELECT coalesce(string_agg(
+                CASE
+                    WHEN jsonb_typeof(o.op -> 'insert') = 'string' THEN o.op ->> 'insert'
+                    WHEN o.op -> 'insert' IS NOT NULL THEN ' '
+                    ELSE ''
+                END, '' ORDER BY o.n), '')
+            INTO words
+            FROM jsonb_array_elements(delta -> 'ops') WITH ORDINALITY AS o(op, n);
+        END IF;
+    END IF;
+    RETURN translate(words, chr(57344) || chr(57345), '');
+END
+$$
+"""
+
+# Must match app.models.document_search.SEARCH_CONFIG; titles rank above content
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(doc_name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, document_text(content)), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(DOCUMENT_TEXT_FUNCTION)
+    # Adding a stored generated column rewrites the table once
+    op.add_column('documents', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed(SEARCH_VECTOR, persisted=True),
+        nullable=True,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_documents_search_vector', 'documents', ['search_vector'], unique=False,
+            postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_documents_search_vector', table_name='documents',
+            postgresql_concurrently=True, if_exists=True,
+        )
+    op.drop_column('documents', 'search_vector')
+    op.execute("DROP FUNCTION IF EXISTS document_text(text)")
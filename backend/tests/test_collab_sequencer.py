@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base
+from app.models.backplane import InProcessBackplane
+from app.models.document_cache import DocumentCache
+from app.models.document_flusher import DocumentFlusher
+from app.models.models import Directory, Document, User
+from app.models.websocket_manager import DocumentManager
+
+DOC_ID = "doc"
+
+
+def insert(position, text):
+    return {"type": "insert", "position": position, "text": text}
+
+
+class FakeWebSocket:
+    """Records what DocumentManager sends to one client."""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        raise AssertionError("Tests use the JSON codec")
+
+    async def close(self, code=1000, reason=None):
+        self.closed = True
+
+    def of_type(self, msg_type):
+        return [message for message in self.sent if message.get("type") == msg_type]
+
+
+class GatedFlusher(DocumentFlusher):
+    """A flusher whose writes wait until `gate` is set, to hold a flush open."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def _write(self, batch):
+        await self.gate.wait()
+        return await super()._write(batch)
+
+
+class SequencerTest(unittest.IsolatedAsyncioTestCase):
+    """Two workers sharing an in-process hub and one SQLite database, as two
+    processes would share a backplane and Postgres."""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'test.db')}")
+        self.session_factory = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with self.session_factory() as session:
+            session.add(User(user_id=1, username="owner", email="owner@example.com", hashed_password="x"))
+            session.add(Directory(dir_id="root", dir_name="root", user_id=1))
+            session.add(Document(doc_id=DOC_ID, doc_name="note", content="hello", user_id=1, directory_id="root"))
+            await session.commit()
+
+        self.hub = []
+        self.first = self.worker()
+        self.second = self.worker()
+
+    async def asyncTearDown(self):
+        for manager in (self.first, self.second):
+            manager.flusher.gate.set()
+            await manager.shutdown()
+        await self.engine.dispose()
+        self.directory.cleanup()
+
+    def worker(self) -> DocumentManager:
+        return DocumentManager(
+            InProcessBackplane(hub=self.hub),
+            GatedFlusher(session_factory=self.session_factory),
+            DocumentCache(session_factory=self.session_factory),
+        )
+
+    async def connect(self, manager, user_id):
+        websocket = FakeWebSocket()
+        # Fail rather than hang if joining waits on a held flush
+        async with asyncio.timeout(5):
+            await manager.connect(DOC_ID, websocket, user_id, f"User {user_id}")
+        return websocket
+
+    async def join(self, manager, user_id):
+        websocket = await self.connect(manager, user_id)
+        await self.until(lambda: websocket.of_type("init"))
+        return websocket
+
+    async def until(self, predicate):
+        for _ in range(500):
+            if predicate():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("Timed out waiting for the workers")
+
+    async def stored_content(self):
+        async with self.session_factory() as session:
+            return (await session.get(Document, DOC_ID)).content
+
+    async def test_second_worker_follows(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        self.assertTrue(self.first.sessions[DOC_ID].sequencer)
+        self.assertFalse(self.second.sessions[DOC_ID].sequencer)
+        self.assertEqual(a.of_type("init")[0]["content"], "hello")
+        self.assertEqual(b.of_type("init")[0]["content"], "hello")
+        self.assertEqual(b.of_type("init")[0]["revision"], 0)
+
+    async def test_forwarded_submit_is_sequenced_and_acked(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        await self.second.handle_message(b, {"type": "ops", "revision": 0, "ops": [insert(5, " world")], "seq": 7})
+        await self.until(lambda: b.of_type("ack") and a.of_type("ops"))
+
+        self.assertEqual(b.of_type("ack"), [{"type": "ack", "revision": 1, "seq": 7}])
+        committed = a.of_type("ops")[0]
+        self.assertEqual((committed["revision"], committed["ops"], committed["user_id"]),
+                         (1, [insert(5, " world")], "2"))
+        self.assertNotIn("origin", committed)
+        self.assertEqual(b.of_type("ops"), [])  # The submitter only gets its ack
+        for manager in (self.first, self.second):
+            session = manager.sessions[DOC_ID]
+            self.assertEqual((session.content, session.revision), ("hello world", 1))
+
+        await self.first.flusher.flush()
+        self.assertEqual(await self.stored_content(), "hello world")
+
+    async def test_forwarded_update_is_relayed(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        await self.second.handle_message(b, {"type": "update", "content": "replaced"})
+        await self.until(lambda: a.of_type("update"))
+
+        self.assertEqual(a.of_type("update")[0]["content"], "replaced")
+        for manager in (self.first, self.second):
+            session = manager.sessions[DOC_ID]
+            self.assertEqual((session.content, session.revision), ("replaced", 1))
+
+    async def test_rejected_submit_resyncs_submitter(self):
+        await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        # Made against a revision the sequencer never committed
+        await self.second.handle_message(b, {"type": "ops", "revision": 5, "ops": [insert(0, "x")], "seq": 1})
+        await self.until(lambda: b.of_type("resync"))
+
+        self.assertEqual(b.of_type("resync")[0], {"type": "resync", "content": "hello", "revision": 0})
+        self.assertEqual(b.of_type("ack"), [])
+        self.assertEqual(self.first.sessions[DOC_ID].revision, 0)
+
+    async def test_concurrent_ops_converge(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        async def edit(manager, websocket, batches):
+            # One batch in flight at a time, each based on the last acked revision
+            revision = 0
+            for seq, ops in enumerate(batches, 1):
+                await manager.handle_message(websocket, {"type": "ops", "revision": revision, "ops": ops, "seq": seq})
+                await self.until(lambda: len(websocket.of_type("ack")) == seq)
+                revision = websocket.of_type("ack")[-1]["revision"]
+
+        await asyncio.gather(
+            edit(self.first, a, [[insert(0, ">")], [insert(0, "[")]]),
+            edit(self.second, b, [[insert(5, "!")], [insert(0, "<")]]),
+        )
+        await self.until(lambda: self.second.sessions[DOC_ID].revision == 4)
+
+        first, second = self.first.sessions[DOC_ID], self.second.sessions[DOC_ID]
+        self.assertEqual((first.content, first.revision), (second.content, second.revision))
+        self.assertEqual(sorted(first.content), sorted("hello>[!<"))
+        self.assertTrue(first.content.endswith("hello!"))
+        self.assertEqual(sorted(ack["revision"] for ack in a.of_type("ack") + b.of_type("ack")), [1, 2, 3, 4])
+
+        await self.first.flusher.flush()
+        self.assertEqual(await self.stored_content(), first.content)
+
+    async def test_follower_behind_resyncs_from_sequencer(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+
+        # The second worker misses revision 1, then sees revision 2
+        self.hub.remove(self.second.backplane)
+        await self.first.handle_message(a, {"type": "ops", "revision": 0, "ops": [insert(0, "1")], "seq": 1})
+        self.hub.append(self.second.backplane)
+        await self.first.handle_message(a, {"type": "ops", "revision": 1, "ops": [insert(0, "2")], "seq": 2})
+        await self.until(lambda: b.of_type("resync"))
+
+        session = self.second.sessions[DOC_ID]
+        self.assertIsNone(session.sync_buffer)
+        self.assertEqual((session.content, session.revision), ("21hello", 2))
+        self.assertEqual(b.of_type("resync")[-1], {"type": "resync", "content": "21hello", "revision": 2})
+
+    async def test_sequencer_disconnect_releases_and_follower_promotes(self):
+        a = await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+        await self.second.handle_message(b, {"type": "ops", "revision": 0, "ops": [insert(5, " world")], "seq": 1})
+        await self.until(lambda: b.of_type("ack"))
+
+        await self.first.disconnect(a)
+        await self.until(lambda: self.second.sessions[DOC_ID].sequencer)
+
+        self.assertNotIn(DOC_ID, self.first.sessions)
+        self.assertNotIn(DOC_ID, self.first.backplane.claimed)
+        self.assertIn(DOC_ID, self.second.backplane.claimed)
+        self.assertEqual(await self.stored_content(), "hello world")
+        await self.until(lambda: b.of_type("resync"))
+        self.assertEqual(b.of_type("resync")[-1], {"type": "resync", "content": "hello world", "revision": 1})
+
+        # The new sequencer commits locally
+        await self.second.handle_message(b, {"type": "ops", "revision": 1, "ops": [insert(0, ">")], "seq": 2})
+        await self.until(lambda: len(b.of_type("ack")) == 2)
+        self.assertEqual(b.of_type("ack")[-1], {"type": "ack", "revision": 2, "seq": 2})
+        self.assertEqual(self.second.sessions[DOC_ID].content, ">hello world")
+
+        # A client returning to the first worker now follows the second one
+        c = await self.join(self.first, "3")
+        self.assertFalse(self.first.sessions[DOC_ID].sequencer)
+        self.assertEqual(c.of_type("init")[0]["content"], ">hello world")
+        self.assertEqual(c.of_type("init")[0]["revision"], 2)
+
+    async def test_reaper_takes_over_claim_of_vanished_sequencer(self):
+        await self.join(self.first, "1")
+        b = await self.join(self.second, "2")
+        await self.second.handle_message(b, {"type": "update", "content": "kept"})
+        await self.until(lambda: self.first.sessions[DOC_ID].content == "kept")
+
+        # The worker dies without releasing its claim
+        await self.first.backplane.stop()
+        await self.second.reap()
+
+        session = self.second.sessions[DOC_ID]
+        self.assertTrue(session.sequencer)
+        self.assertEqual((session.content, session.revision), ("kept", 1))
+        await self.until(lambda: b.of_type("resync"))
+        await self.second.flusher.flush()
+        self.assertEqual(await self.stored_content(), "kept")
+
+    async def test_rejoin_during_flush_keeps_edits(self):
+        a = await self.join(self.first, "1")
+        await self.first.handle_message(a, {"type": "update", "content": "unsaved edit"})
+
+        self.first.flusher.gate.clear()
+        leaving = asyncio.create_task(self.first.disconnect(a))
+        await self.until(lambda: self.first.flusher.writing)
+
+        # The database still has the old content while the flush is held open
+        c = await self.join(self.first, "3")
+        self.assertEqual(c.of_type("init")[0]["content"], "unsaved edit")
+        self.assertTrue(self.first.sessions[DOC_ID].sequencer)
+
+        self.first.flusher.gate.set()
+        await leaving
+        self.assertEqual(await self.stored_content(), "unsaved edit")
+        self.assertIn(DOC_ID, self.first.backplane.claimed)  # Kept for the new session
+
+    async def test_rejoin_on_other_worker_during_flush_keeps_edits(self):
+        a = await self.join(self.first, "1")
+        await self.first.handle_message(a, {"type": "update", "content": "unsaved edit"})
+
+        self.first.flusher.gate.clear()
+        leaving = asyncio.create_task(self.first.disconnect(a))
+        await self.until(lambda: self.first.flusher.writing)
+
+        # The first worker still holds the claim, so the second one waits for it
+        b = await self.connect(self.second, "2")
+        self.assertFalse(self.second.sessions[DOC_ID].sequencer)
+        self.assertEqual(b.of_type("init"), [])
+
+        self.first.flusher.gate.set()
+        await leaving
+        await self.until(lambda: b.of_type("init"))
+
+        session = self.second.sessions[DOC_ID]
+        self.assertTrue(session.sequencer)
+        self.assertEqual(b.of_type("init")[0]["content"], "unsaved edit")
+        self.assertEqual(session.revision, 1)
@@ -0,0 +1,243 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base
+from app.models.inverted_index import InvertedIndex, Segment, highlight
+from app.models.models import Directory, Document, User
+
+LONG_AGO = datetime.now() - timedelta(days=1)
+
+
+class InvertedIndexTest(unittest.IsolatedAsyncioTestCase):
+    """Runs the index against a SQLite database and a segment file in a
+    temporary directory."""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "search-index.bin")
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.directory.name}/test.db")
+        self.session_factory = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with self.session_factory() as session:
+            session.add(User(user_id=1, username="owner", email="owner@example.com", hashed_password="x"))
+            session.add(Directory(dir_id="root", dir_name="root", user_id=1))
+            await session.commit()
+        self.indexes = []
+
+    async def asyncTearDown(self):
+        for index in self.indexes:
+            await index.close()
+        await self.engine.dispose()
+        self.directory.cleanup()
+
+    async def add_documents(self, **contents):
+        # Written well before any segment, so loading only catches up on
+        # documents a test changes afterwards
+        async with self.session_factory() as session:
+            for doc_id, content in contents.items():
+                session.add(Document(doc_id=doc_id, doc_name=doc_id, content=content, user_id=1,
+                                     directory_id="root", updated_at=LONG_AGO))
+            await session.commit()
+
+    async def open_index(self):
+        index = InvertedIndex(self.path, self.session_factory, enabled=True)
+        self.indexes.append(index)
+        await index.ensure_loaded()
+        return index
+
+    def ids(self, results):
+        return [doc_id for doc_id, _ in results]
+
+    async def test_ranks_by_term_frequency_and_length(self):
+        await self.add_documents(
+            once="the garden needs water",
+            twice="garden notes: plant the garden in spring",
+            long="the garden is one of many things on this long list of chores for the weekend",
+            other="nothing relevant here",
+        )
+        index = await self.open_index()
+
+        results = index.search("garden")
+        self.assertEqual(self.ids(results), ["twice", "once", "long"])
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    async def test_all_clauses_must_match_and_negation_excludes(self):
+        await self.add_documents(a="red apples", b="red cherries", c="green apples")
+        index = await self.open_index()
+
+        self.assertEqual(self.ids(index.search("red apples")), ["a"])
+        self.assertEqual(sorted(self.ids(index.search("apples -green"))), ["a"])
+        self.assertEqual(index.search("-apples"), [])
+
+    async def test_allowed_limit_and_offset(self):
+        await self.add_documents(a="note", b="note note", c="note note note")
+        index = await self.open_index()
+
+        self.assertEqual(self.ids(index.search("note", allowed={"a", "b"})), ["b", "a"])
+        everything = self.ids(index.search("note"))
+        self.assertEqual(self.ids(index.search("note", limit=1, offset=1)), everything[1:2])
+
+    async def test_phrase_matches_adjacent_terms_only(self):
+        await self.add_documents(
+            adjacent="a quick brown fox",
+            apart="quick thinking and a brown fox",
+            reversed="the brown quick fox",
+        )
+        index = await self.open_index()
+
+        self.assertEqual(self.ids(index.search('"quick brown"')), ["adjacent"])
+        self.assertEqual(self.ids(index.search('"quick brown fox"')), ["adjacent"])
+        self.assertEqual(sorted(self.ids(index.search('-"quick brown" fox'))), ["apart", "reversed"])
+
+    async def test_prefix_matches_expanded_terms(self):
+        await self.add_documents(a="python scripts", b="pythonic style", c="pyramid scheme")
+        index = await self.open_index()
+
+        self.assertEqual(index.expand("pyth"), ["python", "pythonic"])
+        self.assertEqual(sorted(self.ids(index.search("pyth*"))), ["a", "b"])
+        self.assertEqual(sorted(self.ids(index.search("py*"))), ["a", "b", "c"])
+        self.assertEqual(index.search("java*"), [])
+
+    async def test_update_replaces_terms(self):
+        await self.add_documents(a="old words", b="other words")
+        index = await self.open_index()
+
+        index.update("a", "new content")
+        self.assertEqual(index.search("old"), [])
+        self.assertEqual(self.ids(index.search("new")), ["a"])
+        self.assertEqual(self.ids(index.search("words")), ["b"])
+
+        index.update("c", "brand new document")
+        self.assertEqual(sorted(self.ids(index.search("new"))), ["a", "c"])
+        self.assertEqual(index.doc_ids(), {"a", "b", "c"})
+        self.assertEqual(index.doc_count, 3)
+
+    async def test_remove_drops_document(self):
+        await self.add_documents(a="shared term", b="shared term too")
+        index = await self.open_index()
+        index.update("c", "shared")
+
+        index.remove("a")
+        index.remove("c")
+        index.remove("missing")
+        self.assertEqual(self.ids(index.search("shared")), ["b"])
+        self.assertEqual(index.doc_ids(), {"b"})
+        self.assertEqual(index.doc_count, 1)
+        self.assertEqual(index.total_length, 3)
+
+    async def test_writes_while_disabled_are_ignored(self):
+        index = InvertedIndex(self.path, self.session_factory, enabled=False)
+        index.update("a", "ignored")
+        await index.ensure_loaded()
+        self.assertFalse(index.loaded)
+        self.assertEqual(index.search("ignored"), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_save_and_reopen_segment(self):
+        await self.add_documents(a="alpha beta gamma", b="beta gamma", c="gamma")
+        index = await self.open_index()
+        self.assertTrue(os.path.exists(self.path))
+
+        # Changes on top of the segment, merged into it on close
+        async with self.session_factory() as session:
+            document = await session.get(Document, "b")
+            document.content = "beta delta"
+            document.updated_at = LONG_AGO + timedelta(seconds=1)  # Assigning the same value lets onupdate stamp now
+            await session.delete(await session.get(Document, "c"))
+            await session.commit()
+        await self.add_documents(d="delta epsilon")
+        index.update("b", "beta delta")
+        index.remove("c")
+        index.update("d", "delta epsilon")
+        queries = ("beta", "gamma", "delta", "eps*", '"alpha beta"', "beta -alpha")
+        before = {query: self.ids(index.search(query)) for query in queries}
+        index.save()
+        # Saving drops the masked postings, which only skewed document frequencies
+        expected = {query: index.search(query) for query in queries}
+        self.assertEqual({query: self.ids(results) for query, results in expected.items()}, before)
+        built_at = index.built_at
+        await index.close()
+
+        segment = Segment(self.path)
+        self.assertEqual(sorted(segment.doc_ids), ["a", "b", "d"])
+        self.assertEqual(segment.built_at, built_at)
+        self.assertEqual([segment.doc_ids[ordinal] for ordinal, _ in segment.postings("gamma")], ["a"])
+        self.assertEqual(segment.df("delta"), 2)
+        self.assertEqual(segment.total_length, 7)
+        segment.close()
+
+        reopened = await self.open_index()
+        self.assertEqual(reopened.doc_count, 3)
+        for query in queries:
+            self.assertEqual(reopened.search(query), expected[query], query)
+
+    async def test_reopen_catches_up_with_database(self):
+        await self.add_documents(a="first version", b="untouched", c="doomed")
+        index = await self.open_index()
+        await index.close()
+
+        async with self.session_factory() as session:
+            document = await session.get(Document, "a")
+            document.content = "second version"
+            await session.delete(await session.get(Document, "c"))
+            await session.commit()
+        await self.add_documents(d="added later")
+
+        reopened = await self.open_index()
+        self.assertEqual(reopened.doc_ids(), {"a", "b", "d"})
+        self.assertEqual(reopened.search("first"), [])
+        self.assertEqual(self.ids(reopened.search("second")), ["a"])
+        self.assertEqual(self.ids(reopened.search("later")), ["d"])
+        self.assertEqual(reopened.search("doomed"), [])
+
+    async def test_unreadable_segment_is_rebuilt(self):
+        await self.add_documents(a="rebuilt from the database")
+        with open(self.path, "wb") as f:
+            f.write(b"not an index")
+
+        index = await self.open_index()
+        self.assertEqual(self.ids(index.search("rebuilt")), ["a"])
+
+    async def test_refresh_rereads_changed_documents(self):
+        await self.add_documents(a="before")
+        index = await self.open_index()
+
+        async with self.session_factory() as session:
+            document = await session.get(Document, "a")
+            document.content = "after"
+            await session.commit()
+        index.built_at -= timedelta(minutes=5)
+        await index.ensure_loaded()
+        self.assertEqual(index.search("before"), [])
+        self.assertEqual(self.ids(index.search("after")), ["a"])
+        self.assertGreater(index.built_at, datetime.now() - timedelta(minutes=1))
+
+
+class HighlightTest(unittest.TestCase):
+    def test_marks_matches_and_escapes_html(self):
+        snippet = highlight("Fish <b>&</b> chips <script>alert('x')</script> done", "fish chips")
+        self.assertEqual(
+            snippet,
+            "<mark>Fish</mark> &lt;b&gt;&amp;&lt;/b&gt; <mark>chips</mark> "
+            "&lt;script&gt;alert(&#x27;x&#x27;)&lt;/script&gt; done",
+        )
+
+    def test_marks_prefix_matches_and_ignores_negated_terms(self):
+        snippet = highlight("notes about notebooks, not laptops", "note* -laptops")
+        self.assertEqual(snippet, "<mark>notes</mark> about <mark>notebooks</mark>, not laptops")
+
+    def test_window_around_first_match(self):
+        content = " ".join(f"word{i}" for i in range(100))
+        snippet = highlight(content, "word50", words=9)
+        self.assertEqual(snippet, "...word47 word48 word49 <mark>word50</mark> word51 word52 word53 word54 word55...")
+
+    def test_no_text(self):
+        self.assertEqual(highlight("", "anything"), "")
+        self.assertEqual(highlight("<>&", "anything"), "")
@@ -0,0 +1,111 @@
+import random
+import unittest
+
+from app.models.operations import (
+    InvalidOperation,
+    apply_operations,
+    normalize_operations,
+    transform,
+)
+
+
+def insert(position, text):
+    return {"type": "insert", "position": position, "text": text}
+
+
+def delete(position, length):
+    return {"type": "delete", "position": position, "length": length}
+
+
+def random_ops(rng, text, count):
+    ops = []
+    for _ in range(count):
+        if text and rng.random() < 0.5:
+            position = rng.randrange(len(text))
+            length = rng.randint(1, min(5, len(text) - position))
+            ops.append(delete(position, length))
+            text = text[:position] + text[position + length:]
+        else:
+            position = rng.randint(0, len(text))
+            inserted = rng.choice("abc") * rng.randint(1, 3)
+            ops.append(insert(position, inserted))
+            text = text[:position] + inserted + text[position:]
+    return ops
+
+
+class NormalizeOperationsTest(unittest.TestCase):
+    def test_drops_empty_ops(self):
+        ops = normalize_operations([insert(0, ""), delete(0, 0), insert(1, "x")])
+        self.assertEqual(ops, [insert(1, "x")])
+
+    def test_rejects_malformed_ops(self):
+        for raw in ({}, [1], [{"type": "move", "position": 0}], [insert(-1, "x")],
+                    [insert(True, "x")], [delete(0, -1)], [{"type": "insert", "position": 0}]):
+            with self.subTest(raw=raw), self.assertRaises(InvalidOperation):
+                normalize_operations(raw)
+
+    def test_rejects_batches_over_the_cap(self):
+        normalize_operations([insert(0, "x")] * 3, max_ops=3)
+        with self.assertRaises(InvalidOperation):
+            normalize_operations([insert(0, "x")] * 4, max_ops=3)
+
+
+class ApplyOperationsTest(unittest.TestCase):
+    def test_applies_in_order(self):
+        self.assertEqual(apply_operations("hello", [insert(5, " world"), delete(0, 1)]), "ello world")
+
+    def test_rejects_out_of_range(self):
+        with self.assertRaises(InvalidOperation):
+            apply_operations("abc", [insert(4, "x")])
+        with self.assertRaises(InvalidOperation):
+            apply_operations("abc", [delete(2, 2)])
+
+
+class TransformTest(unittest.TestCase):
+    def assertConverges(self, text, left, right, left_first=False):
+        left_prime, right_prime = transform(left, right, left_first)
+        self.assertEqual(
+            apply_operations(apply_operations(text, right), left_prime),
+            apply_operations(apply_operations(text, left), right_prime),
+        )
+        return left_prime, right_prime
+
+    def test_empty_sides(self):
+        self.assertEqual(transform([], [insert(0, "x")]), ([], [insert(0, "x")]))
+        self.assertEqual(transform([insert(0, "x")], []), ([insert(0, "x")], []))
+
+    def test_inserts_at_the_same_position_are_ordered_by_left_first(self):
+        left_prime, right_prime = self.assertConverges("ab", [insert(1, "L")], [insert(1, "R")], left_first=True)
+        self.assertEqual(apply_operations("aRb", left_prime), "aLRb")
+        left_prime, _ = self.assertConverges("ab", [insert(1, "L")], [insert(1, "R")], left_first=False)
+        self.assertEqual(apply_operations("aRb", left_prime), "aRLb")
+
+    def test_insert_inside_a_delete_is_kept(self):
+        left_prime, right_prime = self.assertConverges("abcdef", [delete(1, 4)], [insert(3, "X")])
+        self.assertEqual(left_prime, [delete(1, 2), delete(2, 2)])
+        self.assertEqual(apply_operations("abcXdef", left_prime), "aXf")
+
+    def test_overlapping_deletes(self):
+        left_prime, right_prime = self.assertConverges("abcdef", [delete(1, 3)], [delete(2, 3)])
+        self.assertEqual(apply_operations("abf", left_prime), "af")
+
+    def test_random_batches_converge(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            text = "".join(rng.choice("0123456789") for _ in range(rng.randint(0, 30)))
+            left = random_ops(rng, text, rng.randint(0, 8))
+            right = random_ops(rng, text, rng.randint(0, 8))
+            with self.subTest(text=text, left=left, right=right):
+                self.assertConverges(text, left, right, rng.random() < 0.5)
+
+    def test_long_batches_do_not_recurse(self):
+        # Used to raise RecursionError at around 1,200 ops on either side
+        rng = random.Random(1)
+        text = "x" * 5000
+        left = random_ops(rng, text, 1500)
+        right = [insert(0, "y")] * 1500
+        self.assertConverges(text, left, right)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,11 +22,12 @@ export default function useCollaborativeEditing(docId, setContent) {
       return;
     }
 
-    const wsUrl = `${WEBSOCKET_URL}/ws/${docId}?user_id=${encodeURIComponent(
-      currentUserId
-    )}&user_name=${encodeURIComponent(currentUserName)}`;
+    // The server identifies the user from the token; browsers cannot send
+    // an Authorization header with the handshake
+    const token = localStorage.getItem("token") || "";
+    const wsUrl = `${WEBSOCKET_URL}/ws/${docId}?token=${encodeURIComponent(token)}`;
 
-    console.log(`Connecting to WebSocket: ${wsUrl}`);
+    console.log(`Connecting to WebSocket: ${WEBSOCKET_URL}/ws/${docId}`);
     socketRef.current = new WebSocket(wsUrl);
 
     socketRef.current.onopen = () => {
@@ -106,6 +107,23 @@ export default function useCollaborativeEditing(docId, setContent) {
             }
             break;
 
+          case "cursors":
+            setRemoteCursors((prev) => {
+              const newCursors = new Map(prev);
+              for (const cursor of data.cursors || []) {
+                if (String(cursor.user_id) !== String(currentUserId) && cursor.position) {
+                  newCursors.set(cursor.user_id, {
+                    position: cursor.position,
+                    user_name: cursor.user_name || "Anonymous",
+                    color: cursor.color || "#3b82f6",
+                    timestamp: Date.now(),
+                  });
+                }
+              }
+              return newCursors;
+            });
+            break;
+
           case "cursor_removed":
             setRemoteCursors((prev) => {
               const newCursors = new Map(prev);
@@ -114,6 +132,13 @@ export default function useCollaborativeEditing(docId, setContent) {
             });
             break;
 
+          case "ping":
+            socketRef.current?.send(JSON.stringify({ type: "pong" }));
+            break;
+
+          case "pong":
+            break;
+
           case "error":
             console.error("Server error:", data.message);
             setConnectionError(data.message);
@@ -25,7 +25,6 @@ const flattenData = (data) => {
         isStared: node.is_stared,
         parent_id: node.directory_id || parentId,
         name: node.name,
-        content: node.content || "",
         created_at: node.created_at,
         updated_at: node.updated_at,
       });